@@ -1,379 +1,2488 @@
-import os
-import io
-import base64
-import qrcode
-from flask import Flask, request, send_file, jsonify
-from flask_cors import CORS
-from jinja2 import Template
-from weasyprint import HTML
-from pypdf import PdfWriter, PdfReader
-
-app = Flask(__name__)
-CORS(app)
-
-# --- Helper Functions ---
-
-def generate_qr_base64(data):
-    qr = qrcode.QRCode(box_size=10, border=0)
-    qr.add_data(data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    return "data:image/png;base64," + base64.b64encode(buffered.getvalue()).decode()
-
-def to_bangla_num(n):
-    return str(n).translate(str.maketrans("0123456789", "০১২৩৪৫৬৭৮৯"))
-
-# --- HTML Template (Re-designed with Tables for reliability) ---
-
-html_template_str = """
-<!DOCTYPE html>
-<html lang="bn">
-<head>
-    <meta charset="UTF-8">
-    <title>Ebook Template</title>
-    <link href="https://fonts.googleapis.com/css2?family=Cormorant+Garamond:wght@300;400;500;600;700&family=Crimson+Pro:wght@400;600;700&family=Noto+Serif+Bengali:wght@400;600;700;800&family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
-    <style>
-        /* GLOBAL RESET & PAGE SETUP */
-        @page { size: A4; margin: 0; }
-        * { margin: 0; padding: 0; box-sizing: border-box; -webkit-print-color-adjust: exact; print-color-adjust: exact; }
-        
-        :root {
-            --primary-color: #1a1a2e; --accent-color: #e94560; --premium-gold: #d4af37; --secondary-dark: #16213e;
-            --paper-white: #fffef9; --cream: #faf8f3; --text-primary: #1a1a1a; --text-secondary: #4a4a4a; --text-muted: #707070; --text-light: #ffffff;
-            --font-display: 'Cormorant Garamond', serif; --font-serif: 'Crimson Pro', serif; --font-bengali: 'Noto Serif Bengali', serif; --font-sans: 'Inter', sans-serif;
-            --title-xl: 72px; --title-lg: 48px; --title-md: 36px; --title-sm: 24px; --body-lg: 16px; --body-md: 14px; --body-sm: 12px; --caption: 11px; --micro: 9px;
-            --space-1: 6px; --space-2: 12px; --space-3: 18px; --space-4: 24px; --space-5: 36px; --space-6: 48px;
-            --safe-margin: 15mm; --shadow-soft: 0 2px 12px rgba(0,0,0,0.08); --shadow-medium: 0 4px 20px rgba(0,0,0,0.15);
-        }
-
-        body { font-family: var(--font-bengali); width: 210mm; background: #2d3142; }
-        .page { width: 210mm; height: 297mm; background: var(--paper-white); position: relative; overflow: hidden; page-break-after: always; }
-
-        /* --- FRONT COVER --- */
-        .front-cover { 
-            background: linear-gradient(165deg, var(--paper-white) 0%, var(--cream) 100%); 
-            display: flex; flex-direction: column; justify-content: space-between; 
-            border: 3mm solid var(--primary-color); 
-            outline: 2px solid var(--premium-gold); outline-offset: -10px; 
-        }
-        .cover-header { padding: var(--space-5) var(--space-4) 0; text-align: center; }
-        .publisher-badge { display: inline-block; background: var(--primary-color); color: var(--text-light); padding: 6px var(--space-3); font-family: var(--font-sans); font-size: var(--micro); font-weight: 700; letter-spacing: 3px; text-transform: uppercase; border-radius: 2px; }
-        .genre-tag { display: block; margin-top: var(--space-2); font-family: var(--font-sans); font-size: var(--caption); color: var(--accent-color); font-weight: 600; letter-spacing: 2px; text-transform: uppercase; }
-        
-        .cover-main { flex: 1; display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; width: 100%; }
-        
-        /* Star Icon Fix */
-        .decorative-icon { width: 60px; height: auto; margin-bottom: var(--space-3); opacity: 0.7; display: block; margin-left: auto; margin-right: auto; }
-        
-        .book-title-en { font-family: var(--font-display); font-size: var(--title-xl); font-weight: 700; line-height: 0.85; color: var(--primary-color); letter-spacing: -1px; text-transform: uppercase; margin: 0; }
-        .book-title-bn { font-family: var(--font-bengali); font-size: var(--title-md); font-weight: 700; color: var(--accent-color); margin-top: var(--space-3); display: inline-block; padding: 0 var(--space-4); position: relative; }
-        .book-title-bn::before, .book-title-bn::after { content: ''; position: absolute; top: 50%; width: 35px; height: 2px; background: var(--accent-color); }
-        .book-title-bn::before { right: 100%; margin-right: 12px; } .book-title-bn::after { left: 100%; margin-left: 12px; }
-        .subtitle { font-family: var(--font-serif); font-size: var(--body-md); color: var(--text-secondary); font-style: italic; margin-top: var(--space-2); max-width: 380px; }
-        .author-block { margin-top: var(--space-5); }
-        .author-label { font-family: var(--font-sans); font-size: var(--caption); color: var(--text-muted); text-transform: uppercase; letter-spacing: 1.5px; font-weight: 600; display: block; margin-bottom: 6px; }
-        .author-name { font-family: var(--font-display); font-size: var(--title-sm); font-weight: 600; color: var(--text-primary); }
-        .cover-footer { padding: 0 var(--space-4) var(--space-5); text-align: center; }
-        .translator-info { padding-top: var(--space-3); border-top: 2px solid rgba(212, 175, 55, 0.2); }
-        .translator-label { font-family: var(--font-sans); font-size: var(--micro); color: var(--accent-color); text-transform: uppercase; letter-spacing: 2.5px; font-weight: 700; display: block; margin-bottom: 6px; }
-        .translator-name { font-family: var(--font-bengali); font-size: var(--body-lg); font-weight: 700; color: var(--primary-color); }
-
-        /* --- COPYRIGHT PAGE (TABLE LAYOUT) --- */
-        .copyright-page { padding: var(--safe-margin); display: flex; flex-direction: column; font-family: var(--font-sans); font-size: var(--body-sm); line-height: 1.6; color: var(--text-secondary); }
-        .copyright-header { text-align: center; padding-bottom: var(--space-3); border-bottom: 1px solid rgba(0,0,0,0.1); margin-bottom: var(--space-3); }
-        .copyright-title { font-family: var(--font-display); font-size: var(--title-sm); color: var(--primary-color); font-weight: 600; }
-        
-        /* Table Styles for Layout Reliability */
-        .layout-table { width: 100%; border-collapse: collapse; table-layout: fixed; }
-        .layout-table td { vertical-align: top; padding-bottom: var(--space-4); }
-        .col-left { padding-right: 15px; }
-        .col-right { padding-left: 15px; }
-        
-        .copyright-section h3 { font-family: var(--font-sans); font-size: var(--caption); font-weight: 700; color: var(--primary-color); text-transform: uppercase; margin-bottom: 6px; }
-        .isbn-block { background: var(--cream); padding: var(--space-2); border-left: 3px solid var(--accent-color); margin-top: 5px; }
-        .copyright-footer { text-align: center; padding-top: var(--space-3); border-top: 1px solid rgba(0,0,0,0.1); margin-top: var(--space-3); font-size: var(--caption); }
-
-        /* --- INDEX PAGE --- */
-        .index-page { padding: var(--safe-margin); display: flex; flex-direction: column; }
-        .index-header { text-align: center; margin-bottom: var(--space-5); position: relative; }
-        .index-title { font-family: var(--font-display); font-size: var(--title-lg); font-weight: 700; color: var(--primary-color); text-transform: uppercase; letter-spacing: 3px; }
-        .index-subtitle { font-family: var(--font-sans); font-size: var(--body-sm); color: var(--accent-color); text-transform: uppercase; letter-spacing: 2px; font-weight: 600; }
-        .toc-table { width: 100%; border-collapse: separate; border-spacing: 0 var(--space-2); }
-        .toc-chapter { font-family: var(--font-bengali); font-size: var(--body-md); font-weight: 600; color: var(--text-primary); padding: var(--space-2) 0; position: relative; }
-        .toc-chapter::after { content: ''; position: absolute; bottom: 8px; left: 0; right: 20px; height: 1px; background: repeating-linear-gradient(to right, var(--text-muted) 0, var(--text-muted) 3px, transparent 3px, transparent 7px); opacity: 0.3; }
-        .toc-page { font-family: var(--font-display); font-size: var(--title-sm); font-weight: 700; color: var(--accent-color); text-align: right; white-space: nowrap; width: 70px; }
-
-        /* --- BACK COVER --- */
-        .back-cover { display: flex; flex-direction: column; background: linear-gradient(165deg, var(--cream) 0%, var(--paper-white) 100%); }
-        .bio-section { flex: 1; display: flex; flex-direction: column; align-items: center; justify-content: center; padding: var(--space-6) var(--space-5); text-align: center; width: 100%; }
-        
-        /* Author Photo Fix */
-        .author-photo { width: 140px; height: 140px; border-radius: 50%; object-fit: cover; border: 4px solid var(--premium-gold); box-shadow: var(--shadow-medium); margin-bottom: var(--space-4); display: block; margin-left: auto; margin-right: auto; }
-        
-        .bio-name { font-family: var(--font-display); font-size: var(--title-sm); font-weight: 700; color: var(--primary-color); margin-bottom: 6px; text-transform: uppercase; }
-        .bio-title-tag { font-family: var(--font-sans); font-size: var(--caption); color: var(--accent-color); text-transform: uppercase; letter-spacing: 2.5px; font-weight: 700; margin-bottom: var(--space-3); display: block; }
-        .bio-description { font-family: var(--font-bengali); font-size: var(--body-md); line-height: 1.7; color: var(--text-secondary); max-width: 420px; margin: 0 auto; }
-        .cta-section { background: linear-gradient(135deg, var(--primary-color) 0%, var(--secondary-dark) 100%); padding: var(--space-5); display: flex; align-items: center; justify-content: space-between; gap: var(--space-4); position: relative; }
-        .cta-section::before { content: ''; position: absolute; top: 0; left: 0; right: 0; height: 4px; background: linear-gradient(90deg, var(--accent-color) 0%, var(--premium-gold) 50%, var(--accent-color) 100%); }
-        .cta-content { flex: 1; max-width: 65%; }
-        .cta-headline { font-family: var(--font-display); font-size: var(--title-sm); font-weight: 700; color: var(--text-light); margin-bottom: var(--space-2); }
-        .cta-text { font-family: var(--font-bengali); font-size: var(--body-md); color: rgba(255,255,255,0.85); line-height: 1.6; }
-        .qr-container { background: white; padding: 10px; border-radius: 8px; width: 100px; height: 100px; display: flex; align-items: center; justify-content: center; border: 2px solid var(--premium-gold); }
-        .qr-container img { width: 100%; height: 100%; border-radius: 4px; }
-    </style>
-</head>
-<body>
-    <div class="page front-cover">
-        <div class="cover-header">
-            <div class="publisher-badge">{{ publisher_badge }}</div>
-            <span class="genre-tag">{{ genre_tag }}</span>
-        </div>
-        <div class="cover-main">
-            <svg class="decorative-icon" viewBox="0 0 100 100" xmlns="http://www.w3.org/2000/svg"><path d="M50 10 L60 40 L90 40 L65 60 L75 90 L50 70 L25 90 L35 60 L10 40 L40 40 Z" fill="none" stroke="#d4af37" stroke-width="2"/></svg>
-            <h1 class="book-title-en">{{ book_title_en }}</h1>
-            <div class="book-title-bn">{{ book_title_bn }}</div>
-            <p class="subtitle">{{ subtitle }}</p>
-            <div class="author-block">
-                <span class="author-label">{{ author_label }}</span>
-                <div class="author-name">{{ author_name }}</div>
-            </div>
-        </div>
-        <div class="cover-footer">
-            <div class="translator-info">
-                <span class="translator-label">{{ translator_label }}</span>
-                <div class="translator-name">{{ translator_name }}</div>
-            </div>
-        </div>
-    </div>
-
-    <div class="page copyright-page">
-        <div class="copyright-header">
-            <h2 class="copyright-title">{{ cp_title }}</h2>
-            <div class="copyright-subtitle">{{ cp_subtitle }}</div>
-        </div>
-        
-        <table class="layout-table">
-            <tr>
-                <td class="col-left">
-                    <div class="copyright-section">
-                        <h3>Original Work</h3>
-                        <p><strong>Author:</strong> {{ cp_original_author }}</p>
-                        <p><strong>Published:</strong> {{ cp_pub_year }}</p>
-                        <p><strong>Language:</strong> {{ cp_lang }}</p>
-                    </div>
-                </td>
-                <td class="col-right">
-                    <div class="copyright-section">
-                        <h3>This Edition</h3>
-                        <p><strong>Translator:</strong> {{ cp_translator }}</p>
-                        <p><strong>Publisher:</strong> {{ cp_publisher }}</p>
-                        <p><strong>Edition:</strong> {{ cp_edition }}</p>
-                    </div>
-                </td>
-            </tr>
-            <tr>
-                <td colspan="2">
-                    <div class="copyright-section">
-                        <h3>ISBN Information</h3>
-                        <div class="isbn-block">
-                            <p class="isbn-label">{{ cp_isbn_13 }}</p>
-                            <p class="isbn-label">{{ cp_isbn_10 }}</p>
-                        </div>
-                    </div>
-                </td>
-            </tr>
-            <tr>
-                <td colspan="2">
-                    <div class="copyright-section">
-                        <h3>Copyright Notice</h3>
-                        <p>{{ cp_copyright_text }}</p>
-                    </div>
-                </td>
-            </tr>
-            <tr>
-                <td class="col-left">
-                    <div class="copyright-section">
-                         <h3>Contact</h3>
-                        <p><strong>Web:</strong> {{ cp_contact_web }}</p>
-                    </div>
-                </td>
-                <td class="col-right">
-                    <div class="copyright-section">
-                        <h3 style="visibility:hidden">Email</h3>
-                        <p><strong>Email:</strong> {{ cp_contact_email }}</p>
-                    </div>
-                </td>
-            </tr>
-        </table>
-
-        <div class="copyright-footer">
-            <p>Designed & Published in Bangladesh</p>
-        </div>
-    </div>
-
-    <div class="page index-page">
-        <div class="index-header">
-            <h2 class="index-title">{{ index_title }}</h2>
-            <span class="index-subtitle">{{ index_subtitle }}</span>
-        </div>
-        <table class="toc-table">
-            {% for item in toc_list %}
-            <tr class="toc-row">
-                <td class="toc-chapter">{{ item.title }}</td>
-                <td class="toc-page">{{ item.page }}</td>
-            </tr>
-            {% endfor %}
-        </table>
-    </div>
-
-    <div class="page back-cover">
-        <div class="bio-section">
-            {% if bio_img_url %}
-            <img src="{{ bio_img_url }}" alt="Translator" class="author-photo">
-            {% endif %}
-            <h3 class="bio-name">{{ bio_name }}</h3>
-            <span class="bio-title-tag">{{ bio_title_tag }}</span>
-            <p class="bio-description">{{ bio_description }}</p>
-        </div>
-        <div class="cta-section">
-            <div class="cta-content">
-                <h3 class="cta-headline">{{ cta_headline }}</h3>
-                <p class="cta-text">{{ cta_text }}</p>
-            </div>
-            <div class="qr-container">
-                <img src="{{ qr_code }}" alt="QR">
-            </div>
-        </div>
-    </div>
-</body>
-</html>
-"""
-
-# --- Main Logic ---
-
-@app.route('/api/generate', methods=['POST'])
-def generate_book():
-    try:
-        data = request.form
-        
-        book_config = {
-            "publisher_badge": data.get("publisher_badge", "THE HIDDEN SHELF CLASSICS"),
-            "genre_tag": data.get("genre_tag", "Political Philosophy"),
-            "book_title_en": data.get("book_title_en", "THE<br>PRINCE"),
-            "book_title_bn": data.get("book_title_bn", "দ্য প্রিন্স"),
-            "subtitle": data.get("subtitle", "A Timeless Manual on Power, Politics, and Leadership"),
-            "author_label": data.get("author_label", "Original Masterpiece By"),
-            "author_name": data.get("author_name", "Niccolò Machiavelli"),
-            "translator_label": data.get("translator_label", "Bengali Translation & Analysis By"),
-            "translator_name": data.get("translator_name", "Touhidul Islam"),
-            "cp_title": data.get("cp_title", "THE PRINCE"),
-            "cp_subtitle": data.get("cp_subtitle", "দ্য প্রিন্স"),
-            "cp_original_author": data.get("cp_original_author", "Niccolò Machiavelli"),
-            "cp_pub_year": data.get("cp_pub_year", "1532 (Posthumous)"),
-            "cp_lang": data.get("cp_lang", "Italian"),
-            "cp_translator": data.get("cp_translator", "Touhidul Islam"),
-            "cp_publisher": data.get("cp_publisher", "The Hidden Shelf"),
-            "cp_edition": data.get("cp_edition", "February 2026"),
-            "cp_isbn_13": data.get("cp_isbn_13", "ISBN-13: 978-0-123456-78-9"),
-            "cp_isbn_10": data.get("cp_isbn_10", "ISBN-10: 0-123456-78-X"),
-            "cp_copyright_text": data.get("cp_copyright_text", "© 2026 The Hidden Shelf. All rights reserved."),
-            "cp_contact_web": data.get("cp_contact_web", "thehiddenshelf.com"),
-            "cp_contact_email": data.get("cp_contact_email", "books@thehiddenshelf.com"),
-            "index_title": data.get("index_title", "Index"),
-            "index_subtitle": data.get("index_subtitle", "Strategic Breakdown"),
-            "bio_name": data.get("bio_name", "Touhidul Islam"),
-            "bio_title_tag": data.get("bio_title_tag", "FOUNDER, THE HIDDEN SHELF"),
-            "bio_description": data.get("bio_description", "A strategic thinker and content strategist analyzing complex geopolitical and historical events in contemporary contexts."),
-            "cta_headline": data.get("cta_headline", "Join the Discussion"),
-            "cta_text": data.get("cta_text", "Join our exclusive strategic community to discuss this book in depth."),
-            "group_link": data.get("group_link", "https://facebook.com/groups/hidden-shelf")
-        }
-
-        if 'author_image' in request.files:
-            image_file = request.files['author_image']
-            image_bytes = image_file.read()
-            encoded = base64.b64encode(image_bytes).decode()
-            book_config['bio_img_url'] = f"data:image/png;base64,{encoded}"
-        else:
-            book_config['bio_img_url'] = "https://i.pravatar.cc/300"
-
-        book_config['qr_code'] = generate_qr_base64(book_config['group_link'])
-
-        chapter_count = int(data.get("chapter_count", 0))
-        toc_data = []
-        merger = PdfWriter()
-        
-        uploaded_pdfs = []
-        current_page_counter = 4
-
-        for i in range(chapter_count):
-            file_key = f"chapter_{i}"
-            title_key = f"chapter_{i}_title"
-            
-            if file_key in request.files:
-                pdf_file = request.files[file_key]
-                pdf_reader = PdfReader(pdf_file)
-                num_pages = len(pdf_reader.pages)
-                
-                title = data.get(title_key, f"Chapter {i+1}")
-                
-                toc_data.append({
-                    "title": title,
-                    "page": to_bangla_num(current_page_counter)
-                })
-                
-                uploaded_pdfs.append({
-                    "reader": pdf_reader,
-                    "title": title
-                })
-                current_page_counter += num_pages
-
-        book_config['toc_list'] = toc_data
-
-        rendered_html = Template(html_template_str).render(**book_config)
-        template_pdf_bytes = io.BytesIO()
-        HTML(string=rendered_html).write_pdf(template_pdf_bytes)
-        template_reader = PdfReader(template_pdf_bytes)
-
-        metadata = {
-            "/Title": f"{book_config['book_title_en'].replace('<br>', ' ')} - {book_config['book_title_bn']}",
-            "/Author": book_config['author_name'],
-            "/Subject": book_config['subtitle'],
-            "/Producer": "The Hidden Shelf Publishing Engine",
-            "/Creator": "Python Automated Script",
-            "/Keywords": f"{book_config['genre_tag']}, {book_config['author_name']}, {book_config['translator_name']}"
-        }
-        merger.add_metadata(metadata)
-
-        pages_to_add_front = min(3, len(template_reader.pages))
-        for i in range(pages_to_add_front):
-            merger.add_page(template_reader.pages[i])
-
-        for item in uploaded_pdfs:
-            merger.add_outline_item(title=item["title"], page_number=len(merger.pages))
-            for page in item["reader"].pages:
-                merger.add_page(page)
-
-        if len(template_reader.pages) > 3:
-            merger.add_page(template_reader.pages[3])
-
-        output_stream = io.BytesIO()
-        merger.write(output_stream)
-        output_stream.seek(0)
-
-        return send_file(
-            output_stream,
-            as_attachment=True,
-            download_name="Full_Customized_Book.pdf",
-            mimetype='application/pdf'
-        )
-
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port)
+import time
+
+# Taken before the heavy imports (WeasyPrint pulls in pango and fontconfig)
+# so the reported startup time includes them.
+_import_started = time.perf_counter()
+
+import os
+import io
+import re
+import math
+import json
+import base64
+import hashlib
+import tempfile
+import uuid
+import shutil
+import logging
+import resource
+import fcntl
+import zipfile
+import threading
+import subprocess
+import multiprocessing.util
+from functools import partial, wraps, lru_cache
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import qrcode
+from flask import Flask, request, send_file, jsonify, g, has_request_context
+from flask_cors import CORS
+from jinja2 import Template
+from weasyprint import HTML, CSS, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+from pypdf import PdfWriter, PdfReader
+from pypdf.generic import ArrayObject, ContentStream, NullObject
+from PIL import Image, ImageOps
+import pypdfium2 as pdfium
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+app = Flask(__name__)
+CORS(app)
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(message)s")
+logger = logging.getLogger(__name__)
+
+# --- Helper Functions ---
+
+def generate_qr_base64(data):
+    """QR code for ``data`` as an SVG data URI, memoized per link.
+
+    Inside a request, its size and the time taken are reported in
+    ``g.qr_code``. bench.py measures it against the old PNG.
+    """
+    started = time.perf_counter()
+    hits = _qr_svg_uri.cache_info().hits
+    uri = _qr_svg_uri(data)
+    ms = (time.perf_counter() - started) * 1000
+    if has_request_context():
+        report_inline_image("qr_code", len(uri), ms, cached=_qr_svg_uri.cache_info().hits > hits)
+    return uri
+
+@lru_cache(maxsize=64)
+def _qr_svg_uri(data):
+    # Each row's dark modules are merged into runs, drawn as 1-unit strokes
+    # through the middle of the row, so the code ends up as one short vector
+    # path in the PDF rather than a raster image. .qr-container is already
+    # white, so there's no background.
+    qr = qrcode.QRCode(border=0)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                runs.append(f"M{start} {y}.5h{x - start}")
+            else:
+                x += 1
+    size = len(matrix)
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}">'
+        f'<path d="{"".join(runs)}" stroke="#000"/></svg>'
+    )
+    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode()).decode()
+
+def to_bangla_num(n):
+    return str(n).translate(str.maketrans("0123456789", "০১২৩৪৫৬৭৮৯"))
+
+# --- Instrumentation ---
+
+# gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR so /metrics aggregates
+# every worker and job pool process instead of whichever worker answers the
+# scrape. Without it (python backend.py, bench.py) only this process counts.
+REQUESTS = Counter("ebook_requests_total", "HTTP requests handled", ["endpoint", "status"])
+REQUEST_LATENCY = Histogram(
+    "ebook_request_duration_seconds", "End-to-end request latency", ["endpoint"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+IN_FLIGHT = Gauge("ebook_requests_in_flight", "Requests currently being handled", multiprocess_mode="livesum")
+STAGE_LATENCY = Histogram(
+    "ebook_stage_duration_seconds", "Time spent in each book build stage", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+BOOK_PAGES = Histogram(
+    "ebook_book_pages", "Pages per generated book",
+    buckets=(8, 16, 32, 64, 128, 256, 512, 1024),
+)
+BYTES_IN = Counter("ebook_chapter_bytes_in_total", "Chapter PDF bytes received")
+BYTES_OUT = Counter("ebook_book_bytes_out_total", "Book PDF bytes produced")
+INLINE_IMAGE_BYTES = Counter(
+    "ebook_inline_image_bytes_total",
+    "Bytes of images inlined into templates, as previously inlined and as now", ["image", "stage"],
+)
+PAGE_CACHE_LOOKUPS = Counter(
+    "ebook_page_cache_lookups_total", "Page cache lookups by kind of entry", ["kind", "result"]
+)
+
+class StageTimings:
+    """Wall-clock durations and counters for one book build."""
+
+    def __init__(self):
+        self.durations = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0) + time.perf_counter() - started
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_ms(self):
+        return {name: round(seconds * 1000, 1) for name, seconds in self.durations.items()}
+
+def report_inline_image(name, bytes_after, ms, bytes_before=None, **extra):
+    """Record what an inlined image (author_image, qr_code) costs, in
+    ``g.<name>`` and the metrics, and against what the old code inlined
+    when that is known without redoing the old work."""
+    INLINE_IMAGE_BYTES.labels(name, "after").inc(bytes_after)
+    report = dict(bytes_after=bytes_after, ms=round(ms, 1))
+    if bytes_before is not None:
+        INLINE_IMAGE_BYTES.labels(name, "before").inc(bytes_before)
+        report.update(bytes_before=bytes_before, bytes_saved=bytes_before - bytes_after)
+    report.update({k: round(v, 1) if isinstance(v, float) else v for k, v in extra.items()})
+    setattr(g, name, report)
+
+def inline_image_headers(response):
+    for name, header in (("author_image", "Author-Image"), ("qr_code", "QR")):
+        report = g.get(name)
+        if report:
+            if "bytes_before" in report:
+                response.headers[f"X-{header}-Size-Before"] = str(report["bytes_before"])
+            response.headers[f"X-{header}-Size-After"] = str(report["bytes_after"])
+
+def server_timing_header(timings_ms):
+    return ", ".join(f"{name};dur={ms}" for name, ms in timings_ms.items())
+
+def record_build_metrics(stats):
+    for stage, ms in stats["timings_ms"].items():
+        STAGE_LATENCY.labels(stage).observe(ms / 1000)
+    BOOK_PAGES.observe(stats["pages"])
+    BYTES_IN.inc(stats["bytes_in"])
+    BYTES_OUT.inc(stats["bytes_out"])
+
+# --- HTML Template (Re-designed with Tables for reliability) ---
+
+html_head_str = """
+<!DOCTYPE html>
+<html lang="bn">
+<head>
+    <meta charset="UTF-8">
+    <title>Ebook Template</title>
+</head>
+<body>
+"""
+
+book_stylesheet_str = """
+    /* GLOBAL RESET & PAGE SETUP */
+    @page { size: A4; margin: 0; }
+    * { margin: 0; padding: 0; box-sizing: border-box; -webkit-print-color-adjust: exact; print-color-adjust: exact; }
+    
+    :root {
+        --primary-color: #1a1a2e; --accent-color: #e94560; --premium-gold: #d4af37; --secondary-dark: #16213e;
+        --paper-white: #fffef9; --cream: #faf8f3; --text-primary: #1a1a1a; --text-secondary: #4a4a4a; --text-muted: #707070; --text-light: #ffffff;
+        --font-display: 'Cormorant Garamond', serif; --font-serif: 'Crimson Pro', serif; --font-bengali: 'Noto Serif Bengali', serif; --font-sans: 'Inter', sans-serif;
+        --title-xl: 72px; --title-lg: 48px; --title-md: 36px; --title-sm: 24px; --body-lg: 16px; --body-md: 14px; --body-sm: 12px; --caption: 11px; --micro: 9px;
+        --space-1: 6px; --space-2: 12px; --space-3: 18px; --space-4: 24px; --space-5: 36px; --space-6: 48px;
+        --safe-margin: 15mm; --shadow-soft: 0 2px 12px rgba(0,0,0,0.08); --shadow-medium: 0 4px 20px rgba(0,0,0,0.15);
+    }
+
+    body { font-family: var(--font-bengali); width: 210mm; background: #2d3142; }
+    .page { width: 210mm; height: 297mm; background: var(--paper-white); position: relative; overflow: hidden; page-break-after: always; }
+
+    /* --- FRONT COVER --- */
+    .front-cover { 
+        background: linear-gradient(165deg, var(--paper-white) 0%, var(--cream) 100%); 
+        display: flex; flex-direction: column; justify-content: space-between; 
+        border: 3mm solid var(--primary-color); 
+        outline: 2px solid var(--premium-gold); outline-offset: -10px; 
+    }
+    .cover-header { padding: var(--space-5) var(--space-4) 0; text-align: center; }
+    .publisher-badge { display: inline-block; background: var(--primary-color); color: var(--text-light); padding: 6px var(--space-3); font-family: var(--font-sans); font-size: var(--micro); font-weight: 700; letter-spacing: 3px; text-transform: uppercase; border-radius: 2px; }
+    .genre-tag { display: block; margin-top: var(--space-2); font-family: var(--font-sans); font-size: var(--caption); color: var(--accent-color); font-weight: 600; letter-spacing: 2px; text-transform: uppercase; }
+    
+    .cover-main { flex: 1; display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center; width: 100%; }
+    
+    /* Star Icon Fix */
+    .decorative-icon { width: 60px; height: auto; margin-bottom: var(--space-3); opacity: 0.7; display: block; margin-left: auto; margin-right: auto; }
+    
+    .book-title-en { font-family: var(--font-display); font-size: var(--title-xl); font-weight: 700; line-height: 0.85; color: var(--primary-color); letter-spacing: -1px; text-transform: uppercase; margin: 0; }
+    .book-title-bn { font-family: var(--font-bengali); font-size: var(--title-md); font-weight: 700; color: var(--accent-color); margin-top: var(--space-3); display: inline-block; padding: 0 var(--space-4); position: relative; }
+    .book-title-bn::before, .book-title-bn::after { content: ''; position: absolute; top: 50%; width: 35px; height: 2px; background: var(--accent-color); }
+    .book-title-bn::before { right: 100%; margin-right: 12px; } .book-title-bn::after { left: 100%; margin-left: 12px; }
+    .subtitle { font-family: var(--font-serif); font-size: var(--body-md); color: var(--text-secondary); font-style: italic; margin-top: var(--space-2); max-width: 380px; }
+    .author-block { margin-top: var(--space-5); }
+    .author-label { font-family: var(--font-sans); font-size: var(--caption); color: var(--text-muted); text-transform: uppercase; letter-spacing: 1.5px; font-weight: 600; display: block; margin-bottom: 6px; }
+    .author-name { font-family: var(--font-display); font-size: var(--title-sm); font-weight: 600; color: var(--text-primary); }
+    .cover-footer { padding: 0 var(--space-4) var(--space-5); text-align: center; }
+    .translator-info { padding-top: var(--space-3); border-top: 2px solid rgba(212, 175, 55, 0.2); }
+    .translator-label { font-family: var(--font-sans); font-size: var(--micro); color: var(--accent-color); text-transform: uppercase; letter-spacing: 2.5px; font-weight: 700; display: block; margin-bottom: 6px; }
+    .translator-name { font-family: var(--font-bengali); font-size: var(--body-lg); font-weight: 700; color: var(--primary-color); }
+
+    /* --- COPYRIGHT PAGE (TABLE LAYOUT) --- */
+    .copyright-page { padding: var(--safe-margin); display: flex; flex-direction: column; font-family: var(--font-sans); font-size: var(--body-sm); line-height: 1.6; color: var(--text-secondary); }
+    .copyright-header { text-align: center; padding-bottom: var(--space-3); border-bottom: 1px solid rgba(0,0,0,0.1); margin-bottom: var(--space-3); }
+    .copyright-title { font-family: var(--font-display); font-size: var(--title-sm); color: var(--primary-color); font-weight: 600; }
+    
+    /* Table Styles for Layout Reliability */
+    .layout-table { width: 100%; border-collapse: collapse; table-layout: fixed; }
+    .layout-table td { vertical-align: top; padding-bottom: var(--space-4); }
+    .col-left { padding-right: 15px; }
+    .col-right { padding-left: 15px; }
+    
+    .copyright-section h3 { font-family: var(--font-sans); font-size: var(--caption); font-weight: 700; color: var(--primary-color); text-transform: uppercase; margin-bottom: 6px; }
+    .isbn-block { background: var(--cream); padding: var(--space-2); border-left: 3px solid var(--accent-color); margin-top: 5px; }
+    .copyright-footer { text-align: center; padding-top: var(--space-3); border-top: 1px solid rgba(0,0,0,0.1); margin-top: var(--space-3); font-size: var(--caption); }
+
+    /* --- INDEX PAGE --- */
+    .index-page { padding: var(--safe-margin); display: flex; flex-direction: column; }
+    .index-header { text-align: center; margin-bottom: var(--space-5); position: relative; }
+    .index-title { font-family: var(--font-display); font-size: var(--title-lg); font-weight: 700; color: var(--primary-color); text-transform: uppercase; letter-spacing: 3px; }
+    .index-subtitle { font-family: var(--font-sans); font-size: var(--body-sm); color: var(--accent-color); text-transform: uppercase; letter-spacing: 2px; font-weight: 600; }
+    .toc-table { width: 100%; border-collapse: separate; border-spacing: 0 var(--space-2); }
+    .toc-chapter { font-family: var(--font-bengali); font-size: var(--body-md); font-weight: 600; color: var(--text-primary); padding: var(--space-2) 0; position: relative; }
+    .toc-chapter::after { content: ''; position: absolute; bottom: 8px; left: 0; right: 20px; height: 1px; background: repeating-linear-gradient(to right, var(--text-muted) 0, var(--text-muted) 3px, transparent 3px, transparent 7px); opacity: 0.3; }
+    .toc-page { font-family: var(--font-display); font-size: var(--title-sm); font-weight: 700; color: var(--accent-color); text-align: right; white-space: nowrap; width: 70px; }
+
+    /* --- BACK COVER --- */
+    .back-cover { display: flex; flex-direction: column; background: linear-gradient(165deg, var(--cream) 0%, var(--paper-white) 100%); }
+    .bio-section { flex: 1; display: flex; flex-direction: column; align-items: center; justify-content: center; padding: var(--space-6) var(--space-5); text-align: center; width: 100%; }
+    
+    /* Author Photo Fix */
+    .author-photo { width: 140px; height: 140px; border-radius: 50%; object-fit: cover; border: 4px solid var(--premium-gold); box-shadow: var(--shadow-medium); margin-bottom: var(--space-4); display: block; margin-left: auto; margin-right: auto; }
+    
+    .bio-name { font-family: var(--font-display); font-size: var(--title-sm); font-weight: 700; color: var(--primary-color); margin-bottom: 6px; text-transform: uppercase; }
+    .bio-title-tag { font-family: var(--font-sans); font-size: var(--caption); color: var(--accent-color); text-transform: uppercase; letter-spacing: 2.5px; font-weight: 700; margin-bottom: var(--space-3); display: block; }
+    .bio-description { font-family: var(--font-bengali); font-size: var(--body-md); line-height: 1.7; color: var(--text-secondary); max-width: 420px; margin: 0 auto; }
+    .cta-section { background: linear-gradient(135deg, var(--primary-color) 0%, var(--secondary-dark) 100%); padding: var(--space-5); display: flex; align-items: center; justify-content: space-between; gap: var(--space-4); position: relative; }
+    .cta-section::before { content: ''; position: absolute; top: 0; left: 0; right: 0; height: 4px; background: linear-gradient(90deg, var(--accent-color) 0%, var(--premium-gold) 50%, var(--accent-color) 100%); }
+    .cta-content { flex: 1; max-width: 65%; }
+    .cta-headline { font-family: var(--font-display); font-size: var(--title-sm); font-weight: 700; color: var(--text-light); margin-bottom: var(--space-2); }
+    .cta-text { font-family: var(--font-bengali); font-size: var(--body-md); color: rgba(255,255,255,0.85); line-height: 1.6; }
+    .qr-container { background: white; padding: 10px; border-radius: 8px; width: 100px; height: 100px; display: flex; align-items: center; justify-content: center; border: 2px solid var(--premium-gold); }
+    .qr-container img { width: 100%; height: 100%; border-radius: 4px; }
+"""
+
+html_tail_str = """
+</body>
+</html>
+"""
+
+# Each template page is rendered (and cached) on its own, so editing one page
+# never invalidates the others.
+page_body_templates_str = {
+    "front_cover": """
+    <div class="page front-cover">
+        <div class="cover-header">
+            <div class="publisher-badge">{{ publisher_badge }}</div>
+            <span class="genre-tag">{{ genre_tag }}</span>
+        </div>
+        <div class="cover-main">
+            <svg class="decorative-icon" viewBox="0 0 100 100" xmlns="http://www.w3.org/2000/svg"><path d="M50 10 L60 40 L90 40 L65 60 L75 90 L50 70 L25 90 L35 60 L10 40 L40 40 Z" fill="none" stroke="#d4af37" stroke-width="2"/></svg>
+            <h1 class="book-title-en">{{ book_title_en }}</h1>
+            <div class="book-title-bn">{{ book_title_bn }}</div>
+            <p class="subtitle">{{ subtitle }}</p>
+            <div class="author-block">
+                <span class="author-label">{{ author_label }}</span>
+                <div class="author-name">{{ author_name }}</div>
+            </div>
+        </div>
+        <div class="cover-footer">
+            <div class="translator-info">
+                <span class="translator-label">{{ translator_label }}</span>
+                <div class="translator-name">{{ translator_name }}</div>
+            </div>
+        </div>
+    </div>
+""",
+    "copyright": """
+    <div class="page copyright-page">
+        <div class="copyright-header">
+            <h2 class="copyright-title">{{ cp_title }}</h2>
+            <div class="copyright-subtitle">{{ cp_subtitle }}</div>
+        </div>
+        
+        <table class="layout-table">
+            <tr>
+                <td class="col-left">
+                    <div class="copyright-section">
+                        <h3>Original Work</h3>
+                        <p><strong>Author:</strong> {{ cp_original_author }}</p>
+                        <p><strong>Published:</strong> {{ cp_pub_year }}</p>
+                        <p><strong>Language:</strong> {{ cp_lang }}</p>
+                    </div>
+                </td>
+                <td class="col-right">
+                    <div class="copyright-section">
+                        <h3>This Edition</h3>
+                        <p><strong>Translator:</strong> {{ cp_translator }}</p>
+                        <p><strong>Publisher:</strong> {{ cp_publisher }}</p>
+                        <p><strong>Edition:</strong> {{ cp_edition }}</p>
+                    </div>
+                </td>
+            </tr>
+            <tr>
+                <td colspan="2">
+                    <div class="copyright-section">
+                        <h3>ISBN Information</h3>
+                        <div class="isbn-block">
+                            <p class="isbn-label">{{ cp_isbn_13 }}</p>
+                            <p class="isbn-label">{{ cp_isbn_10 }}</p>
+                        </div>
+                    </div>
+                </td>
+            </tr>
+            <tr>
+                <td colspan="2">
+                    <div class="copyright-section">
+                        <h3>Copyright Notice</h3>
+                        <p>{{ cp_copyright_text }}</p>
+                    </div>
+                </td>
+            </tr>
+            <tr>
+                <td class="col-left">
+                    <div class="copyright-section">
+                         <h3>Contact</h3>
+                        <p><strong>Web:</strong> {{ cp_contact_web }}</p>
+                    </div>
+                </td>
+                <td class="col-right">
+                    <div class="copyright-section">
+                        <h3 style="visibility:hidden">Email</h3>
+                        <p><strong>Email:</strong> {{ cp_contact_email }}</p>
+                    </div>
+                </td>
+            </tr>
+        </table>
+
+        <div class="copyright-footer">
+            <p>Designed & Published in Bangladesh</p>
+        </div>
+    </div>
+""",
+    "index": """
+    <div class="page index-page">
+        <div class="index-header">
+            <h2 class="index-title">{{ index_title }}</h2>
+            <span class="index-subtitle">{{ index_subtitle }}</span>
+        </div>
+        <table class="toc-table">
+            {% for item in toc_list %}
+            <tr class="toc-row">
+                <td class="toc-chapter">{{ item.title }}</td>
+                <td class="toc-page">{{ item.page }}</td>
+            </tr>
+            {% endfor %}
+        </table>
+    </div>
+""",
+    "back_cover": """
+    <div class="page back-cover">
+        <div class="bio-section">
+            {% if bio_img_url %}
+            <img src="{{ bio_img_url }}" alt="Translator" class="author-photo">
+            {% endif %}
+            <h3 class="bio-name">{{ bio_name }}</h3>
+            <span class="bio-title-tag">{{ bio_title_tag }}</span>
+            <p class="bio-description">{{ bio_description }}</p>
+        </div>
+        <div class="cta-section">
+            <div class="cta-content">
+                <h3 class="cta-headline">{{ cta_headline }}</h3>
+                <p class="cta-text">{{ cta_text }}</p>
+            </div>
+            <div class="qr-container">
+                <img src="{{ qr_code }}" alt="QR">
+            </div>
+        </div>
+    </div>
+""",
+}
+
+TEMPLATE_PAGES = ("front_cover", "copyright", "index", "back_cover")
+
+page_templates = {
+    name: Template(html_head_str + body + html_tail_str)
+    for name, body in page_body_templates_str.items()
+}
+
+page_template_versions = {
+    name: hashlib.sha256((html_head_str + body + html_tail_str).encode()).hexdigest()[:16]
+    for name, body in page_body_templates_str.items()
+}
+
+# The book_config fields each template page actually reads. Only these go
+# into a page's cache key.
+PAGE_FIELDS = {
+    "front_cover": (
+        "publisher_badge", "genre_tag", "book_title_en", "book_title_bn", "subtitle",
+        "author_label", "author_name", "translator_label", "translator_name",
+    ),
+    "copyright": (
+        "cp_title", "cp_subtitle", "cp_original_author", "cp_pub_year", "cp_lang",
+        "cp_translator", "cp_publisher", "cp_edition", "cp_isbn_13", "cp_isbn_10",
+        "cp_copyright_text", "cp_contact_web", "cp_contact_email",
+    ),
+    "index": ("index_title", "index_subtitle", "toc_list"),
+    "back_cover": (
+        "bio_img_url", "bio_name", "bio_title_tag", "bio_description",
+        "cta_headline", "cta_text", "qr_code",
+    ),
+}
+
+# --- Offline Assets ---
+
+# Everything a render needs is served from ASSET_DIR out of memory; fonts are
+# expected as the static TTFs of each family under ASSET_DIR/fonts, put there
+# by fetch_fonts.py.
+ASSET_DIR = os.environ.get("ASSET_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets"))
+ASSET_URL_PREFIX = "asset:"
+PLACEHOLDER_PORTRAIT_URL = ASSET_URL_PREFIX + "placeholder-portrait.svg"
+
+# "block" refuses any non-asset, non-data URL during a render; "log" lets it
+# through but still records it.
+RENDER_NETWORK_POLICY = os.environ.get("RENDER_NETWORK_POLICY", "block")
+
+# Without the bundled fonts every Bengali string falls back to a system font
+# that usually has no Bengali glyphs, so warm-up fails instead. Set to 0 only
+# for local work that doesn't care how the text looks.
+REQUIRE_BUNDLED_FONTS = os.environ.get("REQUIRE_BUNDLED_FONTS", "1") != "0"
+
+FONT_FACES = [
+    ("Noto Serif Bengali", 400, "fonts/NotoSerifBengali-Regular.ttf"),
+    ("Noto Serif Bengali", 600, "fonts/NotoSerifBengali-SemiBold.ttf"),
+    ("Noto Serif Bengali", 700, "fonts/NotoSerifBengali-Bold.ttf"),
+    ("Noto Serif Bengali", 800, "fonts/NotoSerifBengali-ExtraBold.ttf"),
+    ("Cormorant Garamond", 300, "fonts/CormorantGaramond-Light.ttf"),
+    ("Cormorant Garamond", 400, "fonts/CormorantGaramond-Regular.ttf"),
+    ("Cormorant Garamond", 500, "fonts/CormorantGaramond-Medium.ttf"),
+    ("Cormorant Garamond", 600, "fonts/CormorantGaramond-SemiBold.ttf"),
+    ("Cormorant Garamond", 700, "fonts/CormorantGaramond-Bold.ttf"),
+    ("Crimson Pro", 400, "fonts/CrimsonPro-Regular.ttf"),
+    ("Crimson Pro", 600, "fonts/CrimsonPro-SemiBold.ttf"),
+    ("Crimson Pro", 700, "fonts/CrimsonPro-Bold.ttf"),
+    ("Inter", 400, "fonts/Inter-Regular.ttf"),
+    ("Inter", 500, "fonts/Inter-Medium.ttf"),
+    ("Inter", 600, "fonts/Inter-SemiBold.ttf"),
+    ("Inter", 700, "fonts/Inter-Bold.ttf"),
+]
+
+ASSET_MIME_TYPES = {
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    ".woff2": "font/woff2",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+}
+
+def load_assets(directory):
+    assets = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            key = os.path.relpath(path, directory).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                assets[key] = f.read()
+    return assets
+
+asset_store = load_assets(ASSET_DIR) if os.path.isdir(ASSET_DIR) else {}
+missing_font_files = [path for _, _, path in FONT_FACES if path not in asset_store]
+if missing_font_files:
+    logger.warning("Missing bundled fonts (run fetch_fonts.py): %s", ", ".join(missing_font_files))
+
+font_face_css = "\n".join(
+    f"@font-face {{ font-family: '{family}'; font-weight: {weight}; src: url('{ASSET_URL_PREFIX}{path}'); }}"
+    for family, weight, path in FONT_FACES
+    if path in asset_store
+)
+
+external_fetches = {"blocked": 0, "allowed": 0}
+
+def asset_url_fetcher(url, timeout=10, ssl_context=None):
+    if url.startswith(ASSET_URL_PREFIX):
+        name = url[len(ASSET_URL_PREFIX):]
+        if name not in asset_store:
+            raise ValueError(f"Unknown asset: {name}")
+        return {
+            "string": asset_store[name],
+            "mime_type": ASSET_MIME_TYPES.get(os.path.splitext(name)[1].lower()),
+            "redirected_url": url,
+        }
+    if url.startswith("data:"):
+        return default_url_fetcher(url, timeout, ssl_context)
+    if RENDER_NETWORK_POLICY == "log":
+        external_fetches["allowed"] += 1
+        logger.warning("External fetch during render: %s", url)
+        return default_url_fetcher(url, timeout, ssl_context)
+    external_fetches["blocked"] += 1
+    logger.warning("Blocked external fetch during render: %s", url)
+    raise ValueError(f"External URL blocked during render: {url}")
+
+render_style_version = hashlib.sha256(
+    (font_face_css + book_stylesheet_str).encode()
+).hexdigest()[:16]
+
+_render_context = None
+_render_context_lock = threading.Lock()
+
+def get_render_context():
+    """Font configuration and parsed stylesheet, built once per worker."""
+    global _render_context
+    if _render_context is None:
+        with _render_context_lock:
+            if _render_context is None:
+                font_config = FontConfiguration()
+                stylesheet = CSS(
+                    string=font_face_css + book_stylesheet_str,
+                    font_config=font_config,
+                    url_fetcher=asset_url_fetcher,
+                )
+                _render_context = (font_config, stylesheet)
+    return _render_context
+
+def disown_font_files():
+    """Leave the inherited font configuration's files to the process that
+    made them. Call this in a forked worker.
+
+    WeasyPrint writes @font-face files to a temporary folder (a list of
+    temporary files before v60) and deletes it when the FontConfiguration
+    is collected. Each forked worker holds a copy, so a worker exiting
+    normally would delete the master's files out from under every later
+    fork. The worker gets its own, empty folder for any faces it adds.
+    """
+    if _render_context is None:
+        return
+    font_config = _render_context[0]
+    if getattr(font_config, "_folder", None) is not None:
+        font_config._folder = Path(tempfile.mkdtemp(prefix="weasyprint-"))
+    if getattr(font_config, "_filenames", None):
+        font_config._filenames = []
+
+def render_pdf(html_str):
+    font_config, stylesheet = get_render_context()
+    return HTML(string=html_str, url_fetcher=asset_url_fetcher).write_pdf(
+        stylesheets=[stylesheet],
+        font_config=font_config,
+    )
+
+# --- Template Page Cache ---
+
+# What each kind of cache entry is, by file suffix; hits and misses are
+# counted per kind so previews and images don't skew the page numbers.
+PAGE_CACHE_KINDS = {".pdf": "page", ".png": "preview", ".img": "author_image"}
+PAGE_CACHE_SUFFIXES = tuple(PAGE_CACHE_KINDS)
+
+class PageCache:
+    """On-disk LRU of rendered template pages, shared by every worker.
+
+    Entries are stored as ``<key><suffix>``: rendered PDF pages, their PNG
+    previews and normalized author images. Recency is the file mtime,
+    bumped on every hit, and the oldest files are evicted once the directory
+    grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lookups = {kind: {"hits": 0, "misses": 0} for kind in PAGE_CACHE_KINDS.values()}
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def get(self, key, suffix=".pdf"):
+        if not self.enabled:
+            return None
+        path = self._path(key, suffix)
+        kind = PAGE_CACHE_KINDS[suffix]
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.lookups[kind]["misses"] += 1
+            PAGE_CACHE_LOOKUPS.labels(kind, "miss").inc()
+            return None
+        with self._lock:
+            self.lookups[kind]["hits"] += 1
+        PAGE_CACHE_LOOKUPS.labels(kind, "hit").inc()
+        return data
+
+    def put(self, key, data, suffix=".pdf"):
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key, suffix))
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(PAGE_CACHE_SUFFIXES):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        entries = self._entries() if self.enabled else []
+        return {
+            "pid": os.getpid(),
+            "hits": self.lookups["page"]["hits"],
+            "misses": self.lookups["page"]["misses"],
+            "lookups": self.lookups,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+page_cache = PageCache(
+    os.environ.get("PAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ebook-page-cache")),
+    int(os.environ.get("PAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+)
+
+def page_cache_key(page, book_config):
+    fields = {field: book_config[field] for field in PAGE_FIELDS[page]}
+    payload = json.dumps(
+        {
+            "page": page,
+            "template": page_template_versions[page],
+            "style": render_style_version,
+            "fields": fields,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def render_template_pdf(page, book_config, timings=None):
+    """Single-page PDF bytes for one template page, through the page cache."""
+    timings = timings or StageTimings()
+    key = page_cache_key(page, book_config)
+    pdf_bytes = page_cache.get(key)
+    if pdf_bytes is None:
+        timings.count("cache_misses")
+        with timings.stage("jinja"):
+            rendered_html = page_templates[page].render(**book_config)
+        with timings.stage("weasyprint"):
+            pdf_bytes = render_pdf(rendered_html)
+        page_cache.put(key, pdf_bytes)
+    else:
+        timings.count("cache_hits")
+    return pdf_bytes
+
+def render_template_page(page, book_config, timings=None):
+    return PdfReader(io.BytesIO(render_template_pdf(page, book_config, timings))).pages[0]
+
+def render_preview_png(page, book_config, dpi):
+    """Rasterize one template page, memoized on its cache key and ``dpi``."""
+    key = hashlib.sha256(f"{page_cache_key(page, book_config)}:{dpi}".encode()).hexdigest()
+    png_bytes = page_cache.get(key, suffix=".png")
+    if png_bytes is None:
+        document = pdfium.PdfDocument(render_template_pdf(page, book_config))
+        try:
+            image = document[0].render(scale=dpi / 72).to_pil()
+        finally:
+            document.close()
+        buffered = io.BytesIO()
+        image.save(buffered, format="PNG", optimize=True)
+        png_bytes = buffered.getvalue()
+        page_cache.put(key, png_bytes, suffix=".png")
+    return key, png_bytes
+
+# --- Admission Control ---
+
+# Per-request limits.
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", 512 * 1024 * 1024))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 128 * 1024 * 1024))
+MAX_CHAPTERS = int(os.environ.get("MAX_CHAPTERS", 200))
+MAX_CHAPTER_PAGES = int(os.environ.get("MAX_CHAPTER_PAGES", 1000))
+MAX_BOOK_PAGES = int(os.environ.get("MAX_BOOK_PAGES", 3000))
+
+# The shared budget. A request's estimated cost is a fixed base (WeasyPrint,
+# the writer) plus a multiple of its upload size plus a per-page charge;
+# page counts are guessed from chapter_count until preflight has them.
+ADMISSION_BUDGET_BYTES = int(os.environ.get("ADMISSION_BUDGET_BYTES", 1024 * 1024 * 1024))
+ADMISSION_BASE_COST = int(os.environ.get("ADMISSION_BASE_COST", 64 * 1024 * 1024))
+ADMISSION_BYTES_FACTOR = float(os.environ.get("ADMISSION_BYTES_FACTOR", 2.0))
+ADMISSION_PAGE_COST = int(os.environ.get("ADMISSION_PAGE_COST", 64 * 1024))
+ADMISSION_PAGES_PER_CHAPTER = int(os.environ.get("ADMISSION_PAGES_PER_CHAPTER", 20))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 15))
+ADMISSION_MAX_WAITING = int(os.environ.get("ADMISSION_MAX_WAITING", 8))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 5))
+# Background jobs wait this long for budget before failing.
+ADMISSION_JOB_TIMEOUT = float(os.environ.get("ADMISSION_JOB_TIMEOUT", 600))
+ADMISSION_DIR = os.environ.get("ADMISSION_DIR", os.path.join(tempfile.gettempdir(), "ebook-admission"))
+
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+
+ADMISSION_REJECTIONS = Counter("ebook_admission_rejections_total", "Requests turned away by admission control", ["reason"])
+ADMISSION_WAIT = Histogram(
+    "ebook_admission_wait_seconds", "Time spent queued for admission",
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+class RequestRejected(Exception):
+    """A request was turned away before its build started."""
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def to_response(self):
+        response = jsonify({"error": str(self)})
+        if self.retry_after is not None:
+            response.headers["Retry-After"] = str(self.retry_after)
+        return response, self.status
+
+class BookTooLarge(RequestRejected):
+    def __init__(self, message):
+        super().__init__(413, message)
+
+def check_book_pages(total_pages):
+    if total_pages > MAX_BOOK_PAGES:
+        raise BookTooLarge(f"Book has {total_pages} pages, the limit is {MAX_BOOK_PAGES}")
+
+def estimate_request_cost(content_length, chapter_count=0, page_counts=None):
+    pages = sum(page_counts) if page_counts is not None else chapter_count * ADMISSION_PAGES_PER_CHAPTER
+    return int(ADMISSION_BASE_COST + content_length * ADMISSION_BYTES_FACTOR + pages * ADMISSION_PAGE_COST)
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class AdmissionController:
+    """Tracks the estimated cost of in-flight requests across all workers.
+
+    The ledger is a JSON file guarded by flock, so every gunicorn worker in
+    the container sees the same totals. Entries left behind by a dead
+    worker are dropped on the next access. Waiters are admitted in arrival
+    order, so a large request can't be starved by a stream of small ones.
+    """
+
+    def __init__(self, directory, budget, max_waiting, timeout):
+        self.directory = directory
+        self.budget = budget
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.budget > 0
+
+    @contextmanager
+    def _ledger(self):
+        with open(os.path.join(self.directory, "ledger.lock"), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            path = os.path.join(self.directory, "ledger.json")
+            try:
+                with open(path) as f:
+                    ledger = json.load(f)
+            except FileNotFoundError:
+                ledger = {"active": {}, "waiting": {}, "next_seq": 0}
+            except ValueError:
+                logger.warning("Admission ledger %s is unreadable, starting a new one", path)
+                ledger = {"active": {}, "waiting": {}, "next_seq": 0}
+            for section in (ledger["active"], ledger["waiting"]):
+                for token in [t for t, entry in section.items() if not _pid_alive(entry["pid"])]:
+                    del section[token]
+            yield ledger
+            # Replaced, never rewritten in place: a worker dying mid-write
+            # must not wipe every other worker's reservations.
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(ledger, f)
+            os.replace(tmp_path, path)
+
+    def acquire(self, cost, timeout=None, queue=True):
+        """Reserve ``cost`` bytes of budget, waiting up to ``timeout`` (the
+        controller's by default) for room.
+
+        Raises RequestRejected with 429 when too many requests are already
+        queued and 503 when the wait times out. Only the oldest waiter is
+        admitted, once it fits. With ``queue=False`` the caller still waits
+        its turn, but doesn't count towards the queue limit, so it never
+        causes a 429 for HTTP requests.
+        """
+        token = uuid.uuid4().hex
+        if not self.enabled:
+            return AdmissionTicket(self, token, cost)
+
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        try:
+            while True:
+                with self._ledger() as ledger:
+                    waiting = ledger["waiting"]
+                    if token in waiting:
+                        first_in_line = min(waiting, key=lambda t: waiting[t]["seq"]) == token
+                    else:
+                        first_in_line = not waiting
+                    in_flight = sum(entry["cost"] for entry in ledger["active"].values())
+                    # A request bigger than the whole budget may still run,
+                    # but only on its own.
+                    if first_in_line and (not ledger["active"] or in_flight + cost <= self.budget):
+                        waiting.pop(token, None)
+                        ledger["active"][token] = {"pid": os.getpid(), "cost": cost}
+                        ADMISSION_WAIT.observe(time.perf_counter() - started)
+                        return AdmissionTicket(self, token, cost)
+                    if token not in waiting:
+                        if queue and sum(1 for entry in waiting.values() if entry["queued"]) >= self.max_waiting:
+                            ADMISSION_REJECTIONS.labels("queue_full").inc()
+                            raise RequestRejected(429, "Too many requests waiting, try again shortly",
+                                                  retry_after=ADMISSION_RETRY_AFTER)
+                        waiting[token] = {"pid": os.getpid(), "seq": ledger["next_seq"], "queued": queue}
+                        ledger["next_seq"] += 1
+                if time.perf_counter() - started > timeout:
+                    ADMISSION_REJECTIONS.labels("timeout").inc()
+                    raise RequestRejected(503, "Server is at capacity, try again shortly",
+                                          retry_after=ADMISSION_RETRY_AFTER)
+                time.sleep(0.1)
+        except BaseException:
+            # Leave the line, whether turned away or interrupted.
+            with self._ledger() as ledger:
+                ledger["waiting"].pop(token, None)
+            raise
+
+    def update(self, token, cost):
+        if not self.enabled:
+            return
+        with self._ledger() as ledger:
+            if token in ledger["active"]:
+                ledger["active"][token]["cost"] = cost
+
+    def release(self, token):
+        if not self.enabled:
+            return
+        with self._ledger() as ledger:
+            ledger["active"].pop(token, None)
+
+    def stats(self):
+        if not self.enabled:
+            return {"enabled": False}
+        with self._ledger() as ledger:
+            return {
+                "enabled": True,
+                "budget_bytes": self.budget,
+                "in_flight_bytes": sum(entry["cost"] for entry in ledger["active"].values()),
+                "active": len(ledger["active"]),
+                "waiting": len(ledger["waiting"]),
+            }
+
+class AdmissionTicket:
+    def __init__(self, controller, token, cost):
+        self.controller = controller
+        self.token = token
+        self.cost = cost
+
+    def update(self, cost):
+        self.cost = cost
+        self.controller.update(self.token, cost)
+
+    def release(self):
+        self.controller.release(self.token)
+
+admission = AdmissionController(ADMISSION_DIR, ADMISSION_BUDGET_BYTES, ADMISSION_MAX_WAITING, ADMISSION_QUEUE_TIMEOUT)
+
+def upload_size(upload):
+    stream = upload.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+def check_content_length():
+    """Limits that only need the headers; returns the declared size."""
+    if request.content_length is None:
+        raise RequestRejected(411, "Content-Length is required")
+    if request.content_length > MAX_REQUEST_BYTES:
+        raise RequestRejected(413, f"Request exceeds {MAX_REQUEST_BYTES} bytes")
+    return request.content_length
+
+def check_form_limits():
+    """Limits on the parsed form; returns chapter_count. Touching
+    ``request.form`` reads and spools the whole body."""
+    try:
+        chapter_count = int(request.form.get("chapter_count", 0))
+    except ValueError:
+        raise RequestRejected(400, "chapter_count must be an integer")
+    if chapter_count > MAX_CHAPTERS:
+        raise RequestRejected(413, f"At most {MAX_CHAPTERS} chapters per book")
+    for key, upload in request.files.items():
+        if upload_size(upload) > MAX_UPLOAD_BYTES:
+            raise RequestRejected(413, f"{key} exceeds {MAX_UPLOAD_BYTES} bytes")
+    return chapter_count
+
+def check_request_limits():
+    check_content_length()
+    return check_form_limits()
+
+def admission_controlled(view):
+    """Enforce request limits and hold a share of the admission budget for
+    the duration of ``view``. Page counts refine the estimate through
+    ``g.on_preflight`` once preflight has them."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Admission is decided on the declared size alone, so a request that
+        # is queued or turned away hasn't had its body read and spooled.
+        try:
+            content_length = check_content_length()
+            ticket = admission.acquire(estimate_request_cost(content_length))
+        except RequestRejected as e:
+            return e.to_response()
+
+        try:
+            try:
+                chapter_count = check_form_limits()
+            except RequestRejected as e:
+                return e.to_response()
+            ticket.update(estimate_request_cost(content_length, chapter_count))
+            g.on_preflight = lambda page_counts: ticket.update(
+                estimate_request_cost(content_length, page_counts=page_counts)
+            )
+            return view(*args, **kwargs)
+        finally:
+            ticket.release()
+    return wrapper
+
+# --- Book Engine ---
+
+SPOOL_DIR = os.environ.get("SPOOL_DIR") or None
+
+BUILD_STAGES = ("preflight", "rendering_templates", "merging", "optimizing", "writing")
+OPTIMIZE_MAX_IMAGE_DPI = int(os.environ.get("OPTIMIZE_MAX_IMAGE_DPI", 0))
+BATCH_MAX_VARIANTS = int(os.environ.get("BATCH_MAX_VARIANTS", 20))
+PREVIEW_DPI = int(os.environ.get("PREVIEW_DPI", 48))
+PREVIEW_MAX_DPI = int(os.environ.get("PREVIEW_MAX_DPI", 150))
+PREFLIGHT_WORKERS = int(os.environ.get("PREFLIGHT_WORKERS", min(4, os.cpu_count() or 1)))
+QPDF_BINARY = os.environ.get("QPDF_BINARY", "qpdf")
+# .author-photo is 140 CSS px wide, about 440 px at 300 dpi.
+AUTHOR_IMAGE_PX = int(os.environ.get("AUTHOR_IMAGE_PX", 440))
+AUTHOR_IMAGE_QUALITY = int(os.environ.get("AUTHOR_IMAGE_QUALITY", 85))
+
+class ChapterError(Exception):
+    """One or more chapter PDFs failed preflight."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{e['title']}: {e['error']}" for e in errors))
+        self.errors = errors
+
+    def to_response(self):
+        return jsonify({"error": "Invalid chapter files", "chapters": self.errors}), 422
+
+def book_config_from_request(data, files):
+    book_config = {
+        "publisher_badge": data.get("publisher_badge", "THE HIDDEN SHELF CLASSICS"),
+        "genre_tag": data.get("genre_tag", "Political Philosophy"),
+        "book_title_en": data.get("book_title_en", "THE<br>PRINCE"),
+        "book_title_bn": data.get("book_title_bn", "দ্য প্রিন্স"),
+        "subtitle": data.get("subtitle", "A Timeless Manual on Power, Politics, and Leadership"),
+        "author_label": data.get("author_label", "Original Masterpiece By"),
+        "author_name": data.get("author_name", "Niccolò Machiavelli"),
+        "translator_label": data.get("translator_label", "Bengali Translation & Analysis By"),
+        "translator_name": data.get("translator_name", "Touhidul Islam"),
+        "cp_title": data.get("cp_title", "THE PRINCE"),
+        "cp_subtitle": data.get("cp_subtitle", "দ্য প্রিন্স"),
+        "cp_original_author": data.get("cp_original_author", "Niccolò Machiavelli"),
+        "cp_pub_year": data.get("cp_pub_year", "1532 (Posthumous)"),
+        "cp_lang": data.get("cp_lang", "Italian"),
+        "cp_translator": data.get("cp_translator", "Touhidul Islam"),
+        "cp_publisher": data.get("cp_publisher", "The Hidden Shelf"),
+        "cp_edition": data.get("cp_edition", "February 2026"),
+        "cp_isbn_13": data.get("cp_isbn_13", "ISBN-13: 978-0-123456-78-9"),
+        "cp_isbn_10": data.get("cp_isbn_10", "ISBN-10: 0-123456-78-X"),
+        "cp_copyright_text": data.get("cp_copyright_text", "© 2026 The Hidden Shelf. All rights reserved."),
+        "cp_contact_web": data.get("cp_contact_web", "thehiddenshelf.com"),
+        "cp_contact_email": data.get("cp_contact_email", "books@thehiddenshelf.com"),
+        "index_title": data.get("index_title", "Index"),
+        "index_subtitle": data.get("index_subtitle", "Strategic Breakdown"),
+        "bio_name": data.get("bio_name", "Touhidul Islam"),
+        "bio_title_tag": data.get("bio_title_tag", "FOUNDER, THE HIDDEN SHELF"),
+        "bio_description": data.get("bio_description", "A strategic thinker and content strategist analyzing complex geopolitical and historical events in contemporary contexts."),
+        "cta_headline": data.get("cta_headline", "Join the Discussion"),
+        "cta_text": data.get("cta_text", "Join our exclusive strategic community to discuss this book in depth."),
+        "group_link": data.get("group_link", "https://facebook.com/groups/hidden-shelf")
+    }
+
+    if 'author_image' in files:
+        book_config['bio_img_url'] = author_image_url(files['author_image'].read())
+    else:
+        book_config['bio_img_url'] = PLACEHOLDER_PORTRAIT_URL
+
+    return book_config
+
+def normalize_author_image(image_bytes):
+    """Crop and scale an uploaded portrait to what .author-photo shows.
+
+    The photo is displayed as a 140px circle with object-fit: cover, so a
+    centred square of AUTHOR_IMAGE_PX is all WeasyPrint ever needs. EXIF
+    rotation is applied before cropping. The result is a baseline JPEG, or
+    a PNG when the upload has real transparency: .back-cover is a
+    gradient, so there is no one colour to flatten it onto.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("RGB", (AUTHOR_IMAGE_PX, AUTHOR_IMAGE_PX))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            image = image.convert("RGBA")
+            if image.getchannel("A").getextrema()[0] == 255:
+                image = image.convert("RGB")
+        else:
+            image = image.convert("RGB")
+        side = min(image.size)
+        image = ImageOps.fit(image, (min(side, AUTHOR_IMAGE_PX),) * 2, Image.LANCZOS)
+        buffered = io.BytesIO()
+        if image.mode == "RGBA":
+            image.save(buffered, format="PNG", optimize=True)
+        else:
+            image.save(buffered, format="JPEG", quality=AUTHOR_IMAGE_QUALITY, optimize=True)
+        return buffered.getvalue()
+
+def author_image_url(image_bytes):
+    """Data URI for an uploaded author image, normalized once per distinct
+    upload through the page cache.
+
+    Uploads Pillow can't read are inlined unchanged, as before. Sizes and
+    the time taken are reported in ``g.author_image`` either way.
+    """
+    started = time.perf_counter()
+    legacy_prefix = "data:image/png;base64,"
+    # What the old code inlined: the upload as-is, base64-encoded.
+    legacy_size = len(legacy_prefix) + 4 * ((len(image_bytes) + 2) // 3)
+    key = "author-image-" + hashlib.sha256(
+        f"{AUTHOR_IMAGE_PX}:{AUTHOR_IMAGE_QUALITY}:".encode() + image_bytes
+    ).hexdigest()
+    normalized = page_cache.get(key, suffix=".img")
+    cached = normalized is not None
+    if not cached:
+        try:
+            normalized = normalize_author_image(image_bytes)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            logger.warning("Inlining author image as uploaded, could not normalize it: %s", e)
+            report_inline_image("author_image", legacy_size, (time.perf_counter() - started) * 1000,
+                                bytes_before=legacy_size, normalized=False, error=str(e))
+            return legacy_prefix + base64.b64encode(image_bytes).decode()
+        page_cache.put(key, normalized, suffix=".img")
+
+    mimetype = "image/png" if normalized.startswith(b"\x89PNG") else "image/jpeg"
+    uri = f"data:{mimetype};base64," + base64.b64encode(normalized).decode()
+    # Sizes compare the data URIs, which is what the template inlines.
+    report_inline_image("author_image", len(uri), (time.perf_counter() - started) * 1000,
+                        bytes_before=legacy_size, normalized=True, cached=cached)
+    return uri
+
+class InvalidVariants(Exception):
+    """The batch ``variants`` field is missing or malformed."""
+
+def variant_configs_from_request(base_config, data, files):
+    """Apply each entry of the JSON ``variants`` field on top of ``base_config``.
+
+    Returns ``(names, configs)``. A variant may override any book_config
+    field, set a ``name`` for its file in the ZIP, and may come with its own
+    ``author_image_<i>`` upload.
+    """
+    try:
+        variants = json.loads(data.get("variants", ""))
+    except ValueError:
+        raise InvalidVariants("'variants' must be a JSON list of objects")
+    if not isinstance(variants, list) or not variants or not all(isinstance(v, dict) for v in variants):
+        raise InvalidVariants("'variants' must be a non-empty JSON list of objects")
+    if len(variants) > BATCH_MAX_VARIANTS:
+        raise InvalidVariants(f"At most {BATCH_MAX_VARIANTS} variants per batch")
+
+    names = []
+    configs = []
+    for i, variant in enumerate(variants):
+        overrides = {k: v for k, v in variant.items() if k != "name"}
+        unknown = {k for k in overrides if k not in base_config or k == "bio_img_url"}
+        if unknown:
+            raise InvalidVariants(f"Variant {i} has unknown fields: {', '.join(sorted(unknown))}")
+        if not all(isinstance(v, str) for v in overrides.values()):
+            raise InvalidVariants(f"Variant {i} fields must be strings")
+
+        book_config = dict(base_config, **overrides)
+        image_key = f"author_image_{i}"
+        if image_key in files:
+            book_config['bio_img_url'] = author_image_url(files[image_key].read())
+
+        name = re.sub(r"[^\w.-]+", "_", str(variant.get("name") or f"variant_{i + 1}")).strip("._")
+        names.append(f"{i + 1:02d}_{name or 'variant'}.pdf")
+        configs.append(book_config)
+    return names, configs
+
+def preview_toc_from_request(data):
+    # Previews have no chapter uploads, so page counts come from the
+    # optional chapter_<i>_pages fields.
+    chapter_count = int(data.get("chapter_count", 0))
+    if chapter_count > MAX_CHAPTERS:
+        raise RequestRejected(413, f"At most {MAX_CHAPTERS} chapters per book")
+    toc_data = []
+    current_page_counter = 4
+    for i in range(chapter_count):
+        toc_data.append({
+            "title": data.get(f"chapter_{i}_title", f"Chapter {i+1}"),
+            "page": to_bangla_num(current_page_counter)
+        })
+        current_page_counter += int(data.get(f"chapter_{i}_pages", 1))
+    return toc_data
+
+# Every book_config field a request can set directly; bio_img_url only
+# ever comes from an author_image upload.
+BOOK_CONFIG_FIELDS = tuple(k for k in book_config_from_request({}, {}) if k != "bio_img_url")
+
+def form_flag(data, key):
+    return data.get(key, "").lower() in ("1", "true", "yes", "on")
+
+class InvalidOptions(Exception):
+    """A build option has a value that can't be used."""
+
+def book_options_from_request(data):
+    try:
+        max_image_dpi = int(data.get("max_image_dpi", OPTIMIZE_MAX_IMAGE_DPI))
+    except ValueError:
+        raise InvalidOptions("max_image_dpi must be an integer")
+    if max_image_dpi < 0:
+        raise InvalidOptions("max_image_dpi must not be negative")
+    return {
+        "optimize": form_flag(data, "optimize"),
+        "max_image_dpi": max_image_dpi,
+        "linearize": form_flag(data, "linearize"),
+    }
+
+def chapters_from_request(data, files):
+    chapters = []
+    chapter_count = int(data.get("chapter_count", 0))
+    for i in range(chapter_count):
+        file_key = f"chapter_{i}"
+        title_key = f"chapter_{i}_title"
+        if file_key in files:
+            chapters.append((data.get(title_key, f"Chapter {i+1}"), files[file_key]))
+    return chapters
+
+def spool_chapters(chapters, directory):
+    """Save chapter uploads to files in ``directory``; returns (title, path) pairs."""
+    spooled = []
+    for i, (title, upload) in enumerate(chapters):
+        path = os.path.join(directory, f"chapter_{i}.pdf")
+        upload.save(path)
+        spooled.append((title, path))
+    return spooled
+
+_preflight_executor = None
+_preflight_executor_pid = None
+
+def get_preflight_executor():
+    # A process pool: pypdf parsing is pure Python and holds the GIL, so
+    # threads would run it serially and compete with the template stage.
+    global _preflight_executor, _preflight_executor_pid
+    if (_preflight_executor is None or _preflight_executor_pid != os.getpid()
+            or getattr(_preflight_executor, "_broken", False)):
+        _preflight_executor = ProcessPoolExecutor(max_workers=PREFLIGHT_WORKERS)
+        _preflight_executor_pid = os.getpid()
+        # In a job pool process, multiprocessing joins the process's children
+        # on exit; shut this pool down first (and before its queues are
+        # finalized at priority 10) or that join never returns.
+        multiprocessing.util.Finalize(_preflight_executor, _preflight_executor.shutdown, exitpriority=100)
+    return _preflight_executor
+
+def _is_missing(value):
+    return value is None or isinstance(value, NullObject)
+
+def check_page_references(page, number):
+    """Resolve a page's /Contents (each stream, if it's an array) and
+    /Resources. pypdf's non-strict reader turns a dangling reference into
+    null rather than raising, so nulls are treated as broken here."""
+    for key in ("/Contents", "/Resources"):
+        if key not in page:
+            continue
+        value = page[key]
+        if _is_missing(value):
+            raise ValueError(f"Page {number}: {key} points at a missing object")
+        if key == "/Contents" and isinstance(value, ArrayObject):
+            if any(_is_missing(item.get_object()) for item in value):
+                raise ValueError(f"Page {number}: /Contents points at a missing object")
+
+def preflight_chapter(path):
+    """Validate one chapter and return its page count.
+
+    Runs on the preflight pool. Every page's content and resource
+    references are resolved up front so a broken xref fails here instead of
+    half way through the merge. Errors come back as ValueError so they
+    survive the trip out of the pool process.
+    """
+    try:
+        with open(path, "rb") as f:
+            reader = PdfReader(f)
+            if reader.is_encrypted:
+                raise ValueError("PDF is encrypted")
+            if len(reader.pages) == 0:
+                raise ValueError("PDF has no pages")
+            for number, page in enumerate(reader.pages, 1):
+                check_page_references(page, number)
+            return len(reader.pages)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(str(e)) from None
+
+class _CountingSink(io.RawIOBase):
+    # A write-only stream that just counts bytes, to size a PDF without
+    # keeping it.
+    def __init__(self):
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.size += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.size
+
+IDENTITY_MATRIX = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+# Form XObjects nested deeper than this are not searched for images.
+MAX_FORM_DEPTH = 8
+
+def _concat_matrix(m, n):
+    # m x n for PDF's row-vector affine matrices [a b c d e f].
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + b * c2, a * b2 + b * d2,
+            c * a2 + d * c2, c * b2 + d * d2,
+            e * a2 + f * c2 + e2, e * b2 + f * d2 + f2)
+
+def _xobjects_drawing_images(resources):
+    xobjects = resources.get("/XObject") if resources else None
+    if not xobjects:
+        return None
+    xobjects = xobjects.get_object()
+    if any(xobjects[name].get("/Subtype") in ("/Image", "/Form") for name in xobjects):
+        return xobjects
+    return None
+
+def image_placements(page, placements):
+    """Record the largest size, in points, each image on ``page`` is drawn at.
+
+    Walks the page's content stream (and any Form XObjects it draws)
+    tracking the transformation matrix. ``placements`` maps an image's
+    object number to ``{"page", "path", "width", "height", "px"}`` where
+    ``path`` is its key in ``page.images`` and ``px`` its /Width and
+    /Height. Inline images and images only used in patterns are not seen.
+    """
+    def walk(content, xobjects, ctm, path, depth):
+        saved = []
+        for operands, operator in content.operations:
+            if operator == b"q":
+                saved.append(ctm)
+            elif operator == b"Q":
+                ctm = saved.pop() if saved else ctm
+            elif operator == b"cm":
+                ctm = _concat_matrix(tuple(float(x) for x in operands), ctm)
+            elif operator == b"Do" and operands and operands[0] in xobjects:
+                name = operands[0]
+                ref = xobjects.raw_get(name)
+                xobject = xobjects[name].get_object()
+                subtype = xobject.get("/Subtype")
+                if subtype == "/Image" and hasattr(ref, "idnum"):
+                    # The image fills the unit square, so its drawn edges are
+                    # the lengths of the matrix's first two rows.
+                    width, height = math.hypot(ctm[0], ctm[1]), math.hypot(ctm[2], ctm[3])
+                    seen = placements.setdefault(ref.idnum, {
+                        "page": page, "path": path + [name], "width": 0.0, "height": 0.0,
+                        "px": (int(xobject.get("/Width", 0)), int(xobject.get("/Height", 0))),
+                    })
+                    seen["width"] = max(seen["width"], width)
+                    seen["height"] = max(seen["height"], height)
+                elif subtype == "/Form" and depth < MAX_FORM_DEPTH:
+                    form_xobjects = _xobjects_drawing_images(xobject.get("/Resources"))
+                    if form_xobjects:
+                        matrix = tuple(float(x) for x in xobject.get("/Matrix", IDENTITY_MATRIX))
+                        walk(ContentStream(xobject, None), form_xobjects,
+                             _concat_matrix(matrix, ctm), path + [name], depth + 1)
+
+    xobjects = _xobjects_drawing_images(page.get("/Resources"))
+    if xobjects:
+        content = page.get_contents()
+        if content is not None:
+            walk(content, xobjects, IDENTITY_MATRIX, [], 0)
+
+def downsample_images(writer, max_dpi):
+    """Shrink embedded images drawn at more than ``max_dpi``.
+
+    The DPI is taken against the largest size each image is actually drawn
+    at (see image_placements), from its /Width and /Height, so only images
+    that need shrinking are ever decoded. Images with transparency or an
+    unusual colour mode are left alone.
+    """
+    placements = {}
+    for page in writer.pages:
+        image_placements(page, placements)
+
+    replaced = 0
+    for placement in placements.values():
+        px_w, px_h = placement["px"]
+        if not (px_w and px_h and placement["width"] and placement["height"]):
+            continue
+        # Keep the aspect ratio and leave neither axis under max_dpi.
+        scale = max(max_dpi * placement["width"] / 72 / px_w, max_dpi * placement["height"] / 72 / px_h)
+        if scale >= 1:
+            continue
+        page, path = placement["page"], placement["path"]
+        try:
+            image_file = page.images[path]
+            xobject = image_file.indirect_reference.get_object()
+            image = image_file.image
+            if image.mode not in ("RGB", "L", "CMYK") or "/SMask" in xobject:
+                continue
+            size = (max(1, round(px_w * scale)), max(1, round(px_h * scale)))
+            image_file.replace(image.resize(size, Image.LANCZOS), quality=85)
+            replaced += 1
+        except Exception as e:
+            logger.warning("Skipping image %s during downsampling: %s", "/".join(path), e)
+    return replaced
+
+def optimize_book(writer, max_image_dpi=0):
+    """Shrink ``writer`` in place and return what was done.
+
+    ``bytes_before`` costs one extra serialization of the whole book; that
+    time is reported as ``timings_ms["measure"]``.
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    sink = _CountingSink()
+    writer.write(sink)
+    bytes_before = sink.size
+    timings["measure"] = time.perf_counter() - started
+
+    images_downsampled = 0
+    if max_image_dpi > 0:
+        started = time.perf_counter()
+        images_downsampled = downsample_images(writer, max_image_dpi)
+        timings["images"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for page in writer.pages:
+        page.compress_content_streams(level=9)
+    timings["compress"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    writer.compress_identical_objects(remove_duplicates=True, remove_unreferenced=True)
+    timings["dedupe"] = time.perf_counter() - started
+
+    return {
+        "bytes_before": bytes_before,
+        "images_downsampled": images_downsampled,
+        "timings_ms": {step: round(seconds * 1000, 1) for step, seconds in timings.items()},
+    }
+
+def linearize_pdf(path):
+    """Rewrite the PDF at ``path`` linearized ("fast web view") with qpdf.
+
+    A linearized file starts with the first page and a hint table, so a
+    viewer fetching it with Range requests can show the cover before the
+    rest arrives. Returns False, leaving the file as it was, when qpdf
+    isn't installed.
+    """
+    qpdf = shutil.which(QPDF_BINARY)
+    if qpdf is None:
+        logger.warning("qpdf not found, serving %s without linearization", path)
+        return False
+    tmp_path = path + ".linearized"
+    result = subprocess.run([qpdf, "--linearize", path, tmp_path], capture_output=True, text=True)
+    # Exit status 3 means qpdf succeeded with warnings.
+    if result.returncode not in (0, 3):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(f"qpdf failed to linearize the book: {result.stderr.strip()}")
+    os.replace(tmp_path, path)
+    return True
+
+# Set to 0 when something else needs the whole-process peak (bench.py),
+# or when requests run concurrently in one process and would reset each
+# other's high-water mark.
+PEAK_RSS_RESET = os.environ.get("PEAK_RSS_RESET", "1") != "0"
+
+def reset_peak_rss():
+    # Writing "5" to clear_refs resets VmHWM (Linux >= 4.0), which turns the
+    # process high-water mark into a per-request one.
+    if not PEAK_RSS_RESET:
+        return
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def start_preflight(chapters):
+    executor = get_preflight_executor()
+    return [executor.submit(preflight_chapter, path) for _, path in chapters]
+
+def preflight_failed(futures):
+    return any(f.done() and f.exception() is not None for f in futures)
+
+def finish_preflight(chapters, futures, stack):
+    """Collect the preflight results and open a reader on each chapter.
+
+    Readers are opened here, in the calling process, on handles owned by
+    ``stack``; their pages are only parsed as the merge reaches them.
+    """
+    errors = []
+    page_counts = []
+    for i, ((title, _), future) in enumerate(zip(chapters, futures)):
+        try:
+            num_pages = future.result()
+        except Exception as e:
+            errors.append({"index": i, "title": title, "error": str(e)})
+            continue
+        if num_pages > MAX_CHAPTER_PAGES:
+            errors.append({"index": i, "title": title,
+                           "error": f"{num_pages} pages exceeds the {MAX_CHAPTER_PAGES} page limit"})
+        page_counts.append(num_pages)
+    if errors:
+        raise ChapterError(errors)
+    check_book_pages(sum(page_counts))
+
+    toc_data = []
+    uploaded_pdfs = []
+    current_page_counter = 4
+
+    for (title, path), num_pages in zip(chapters, page_counts):
+        pdf_reader = PdfReader(stack.enter_context(open(path, "rb")))
+
+        toc_data.append({
+            "title": title,
+            "page": to_bangla_num(current_page_counter)
+        })
+
+        uploaded_pdfs.append({
+            "pages": pdf_reader.pages,
+            "title": title
+        })
+        current_page_counter += num_pages
+
+    return toc_data, uploaded_pdfs
+
+def build_book(book_config, chapters, output, progress=None, options=None, on_preflight=None):
+    """Build the full book PDF into the file at ``output`` and return build stats.
+
+    ``chapters`` is a list of ``(title, path)`` pairs. Each chapter is read
+    lazily through an open file handle rather than loaded into memory.
+    ``progress`` is called with each stage name from BUILD_STAGES as the
+    build reaches it. ``options`` comes from book_options_from_request.
+    ``on_preflight`` receives the chapter page counts once they are known.
+    """
+    report = progress or (lambda stage: None)
+    timings = StageTimings()
+    book_config = dict(book_config)
+
+    with ExitStack() as stack:
+        # Chapters are preflighted in the pool's processes while this one
+        # does the QR and the template pages that don't depend on page
+        # numbers. The "preflight" timing is wall time from submission to
+        # the last result, so it overlaps with the stages below.
+        report("preflight")
+        preflight_started = time.perf_counter()
+        preflight_futures = start_preflight(chapters)
+
+        with timings.stage("qr"):
+            book_config['qr_code'] = generate_qr_base64(book_config['group_link'])
+
+        report("rendering_templates")
+        template_pages = {}
+        for page in ("front_cover", "copyright", "back_cover"):
+            if preflight_failed(preflight_futures):
+                break
+            template_pages[page] = render_template_page(page, book_config, timings)
+
+        try:
+            toc_data, uploaded_pdfs = finish_preflight(chapters, preflight_futures, stack)
+        finally:
+            timings.durations["preflight"] = time.perf_counter() - preflight_started
+        if on_preflight:
+            on_preflight([len(item["pages"]) for item in uploaded_pdfs])
+
+        book_config['toc_list'] = toc_data
+        bytes_in = sum(os.path.getsize(path) for _, path in chapters)
+        return assemble_book(
+            book_config, template_pages, uploaded_pdfs, output, options or {}, timings, report, bytes_in
+        )
+
+def assemble_book(book_config, template_pages, uploaded_pdfs, output, options, timings, report, bytes_in):
+    """Merge template pages and chapter pages into ``output``.
+
+    ``uploaded_pdfs`` holds ``{"title", "pages"}`` items in book order. Any
+    template page missing from ``template_pages`` is rendered here;
+    ``book_config`` must already carry ``qr_code`` and ``toc_list``.
+    """
+    for page in TEMPLATE_PAGES:
+        if page not in template_pages:
+            template_pages[page] = render_template_page(page, book_config, timings)
+
+    report("merging")
+    merge_started = time.perf_counter()
+    merger = PdfWriter()
+    metadata = {
+        "/Title": f"{book_config['book_title_en'].replace('<br>', ' ')} - {book_config['book_title_bn']}",
+        "/Author": book_config['author_name'],
+        "/Subject": book_config['subtitle'],
+        "/Producer": "The Hidden Shelf Publishing Engine",
+        "/Creator": "Python Automated Script",
+        "/Keywords": f"{book_config['genre_tag']}, {book_config['author_name']}, {book_config['translator_name']}"
+    }
+    merger.add_metadata(metadata)
+
+    merger.add_page(template_pages["front_cover"])
+    merger.add_page(template_pages["copyright"])
+    merger.add_page(template_pages["index"])
+
+    chapter_ranges = []
+    for item in uploaded_pdfs:
+        start = len(merger.pages)
+        for page in item["pages"]:
+            merger.add_page(page)
+        # The bookmark has to point at a page that is already in the writer.
+        merger.add_outline_item(title=item["title"], page_number=start)
+        chapter_ranges.append({"title": item["title"], "start": start, "pages": len(merger.pages) - start})
+
+    merger.add_page(template_pages["back_cover"])
+    timings.durations["merge"] = time.perf_counter() - merge_started
+
+    stats = {}
+    if options.get("optimize"):
+        report("optimizing")
+        with timings.stage("optimize"):
+            stats["optimization"] = optimize_book(merger, options.get("max_image_dpi", 0))
+
+    report("writing")
+    with timings.stage("write"):
+        merger.write(output)
+    if options.get("linearize"):
+        with timings.stage("linearize"):
+            stats["linearized"] = linearize_pdf(output)
+
+    bytes_out = os.path.getsize(output)
+    if "optimization" in stats:
+        stats["optimization"]["bytes_after"] = bytes_out
+    stats.update(
+        timings_ms=timings.as_ms(),
+        pages=len(merger.pages),
+        bytes_in=bytes_in,
+        bytes_out=bytes_out,
+        counters=timings.counters,
+        chapters=chapter_ranges,
+    )
+    record_build_metrics(stats)
+    return stats
+
+def build_book_variants(variant_configs, chapters, outputs, options=None, on_preflight=None):
+    """Build one book per config from a single preflight of ``chapters``.
+
+    Chapter readers are shared by every variant, and template pages are
+    kept by page_cache_key for the length of the batch, so only pages whose
+    fields differ get rendered, even with the page cache off or evicted.
+    Returns the stats of each variant.
+    """
+    report = lambda stage: None
+    with ExitStack() as stack:
+        timings = StageTimings()
+        with timings.stage("preflight"):
+            toc_data, uploaded_pdfs = finish_preflight(chapters, start_preflight(chapters), stack)
+        if on_preflight:
+            on_preflight([len(item["pages"]) for item in uploaded_pdfs])
+        bytes_in = sum(os.path.getsize(path) for _, path in chapters)
+
+        batch_pages = {}
+        all_stats = []
+        for book_config, output in zip(variant_configs, outputs):
+            book_config = dict(book_config, toc_list=toc_data)
+            with timings.stage("qr"):
+                book_config['qr_code'] = generate_qr_base64(book_config['group_link'])
+            template_pages = {}
+            for page in TEMPLATE_PAGES:
+                key = page_cache_key(page, book_config)
+                if key in batch_pages:
+                    timings.count("batch_hits")
+                else:
+                    batch_pages[key] = render_template_page(page, book_config, timings)
+                template_pages[page] = batch_pages[key]
+            all_stats.append(assemble_book(
+                book_config, template_pages, uploaded_pdfs, output, options or {}, timings, report, bytes_in
+            ))
+            # Shared work is only counted against the first variant.
+            timings = StageTimings()
+            bytes_in = 0
+        return all_stats
+
+# --- Background Jobs ---
+
+JOB_DIR = os.environ.get("JOB_DIR", os.path.join(tempfile.gettempdir(), "ebook-jobs"))
+# Both limits apply per gunicorn worker, not per container: every worker
+# runs its own pool of JOB_WORKERS processes and queues up to
+# JOB_QUEUE_LIMIT jobs, so a container runs up to workers x JOB_WORKERS.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", 16))
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 3600))
+
+_job_executor = None
+_job_executor_pid = None
+_jobs_in_flight = 0
+_jobs_lock = threading.Lock()
+
+def get_job_executor():
+    # Executors don't survive a fork, so each gunicorn worker gets its own.
+    global _job_executor, _job_executor_pid
+    if (_job_executor is None or _job_executor_pid != os.getpid()
+            or getattr(_job_executor, "_broken", False)):
+        _job_executor = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+        _job_executor_pid = os.getpid()
+    return _job_executor
+
+def job_path(job_id, *parts):
+    return os.path.join(JOB_DIR, job_id, *parts)
+
+def _load_job_status(job_id):
+    try:
+        with open(job_path(job_id, "status.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def read_job_status(job_id):
+    """The job's status; a queued or running job whose owning worker has
+    exited (recycled or killed, taking its pool with it) reads as failed."""
+    status = _load_job_status(job_id)
+    if status and status["status"] in ("queued", "running") and not _pid_alive(status["owner_pid"]):
+        status.update(status="failed", error=f"Worker {status['owner_pid']} exited before the job finished")
+    return status
+
+def write_job_status(job_id, **fields):
+    status = _load_job_status(job_id) or {"job_id": job_id, "created_at": time.time()}
+    status.update(fields, updated_at=time.time())
+    fd, tmp_path = tempfile.mkstemp(dir=job_path(job_id), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp_path, job_path(job_id, "status.json"))
+    return status
+
+def prune_jobs():
+    if not os.path.isdir(JOB_DIR):
+        return
+    cutoff = time.time() - JOB_TTL_SECONDS
+    for entry in os.scandir(JOB_DIR):
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+def run_book_job(job_id, book_config, chapters, options):
+    def progress(stage):
+        write_job_status(
+            job_id,
+            status="running",
+            stage=stage,
+            progress={"stage": BUILD_STAGES.index(stage) + 1, "stages_total": len(BUILD_STAGES)},
+        )
+
+    ticket = None
+    try:
+        # The pool process reserves its share of the admission budget like
+        # a synchronous request would, without taking a place in the queue
+        # that HTTP requests are turned away from.
+        bytes_in = sum(os.path.getsize(path) for _, path in chapters)
+        write_job_status(job_id, stage="waiting_for_capacity")
+        ticket = admission.acquire(
+            estimate_request_cost(bytes_in, len(chapters)), timeout=ADMISSION_JOB_TIMEOUT, queue=False
+        )
+        on_preflight = lambda page_counts: ticket.update(estimate_request_cost(bytes_in, page_counts=page_counts))
+
+        reset_peak_rss()
+        tmp_output = job_path(job_id, "book.pdf.tmp")
+        stats = build_book(
+            book_config, chapters, tmp_output, progress=progress, options=options, on_preflight=on_preflight
+        )
+        os.replace(tmp_output, job_path(job_id, "book.pdf"))
+        write_job_status(
+            job_id,
+            status="done",
+            stage="done",
+            progress={"stage": len(BUILD_STAGES), "stages_total": len(BUILD_STAGES)},
+            peak_rss_kb=peak_rss_kb(),
+            **stats,
+        )
+    except ChapterError as e:
+        write_job_status(job_id, status="failed", error=str(e), chapters=e.errors)
+    except RequestRejected as e:
+        # BookTooLarge, or no room in the budget within ADMISSION_JOB_TIMEOUT.
+        write_job_status(job_id, status="failed", error=str(e))
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        write_job_status(job_id, status="failed", error=str(e))
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+def _job_finished(job_id, future):
+    global _jobs_in_flight
+    with _jobs_lock:
+        _jobs_in_flight -= 1
+    # run_book_job records its own failures; this only fires if the pool
+    # process itself died.
+    if future.exception() is not None:
+        write_job_status(job_id, status="failed", error=str(future.exception()))
+
+def submit_book_job(book_config, chapters, options):
+    """Spool the chapter uploads into a job directory and queue the build.
+
+    Returns the job id, or None when this worker's queue is full.
+    """
+    global _jobs_in_flight
+    with _jobs_lock:
+        if _jobs_in_flight >= JOB_QUEUE_LIMIT:
+            return None
+        _jobs_in_flight += 1
+
+    try:
+        prune_jobs()
+        job_id = uuid.uuid4().hex
+        os.makedirs(job_path(job_id))
+        spooled = spool_chapters(chapters, job_path(job_id))
+        write_job_status(job_id, status="queued", stage="queued", owner_pid=os.getpid(),
+                         progress={"stage": 0, "stages_total": len(BUILD_STAGES)})
+        future = get_job_executor().submit(run_book_job, job_id, book_config, spooled, options)
+    except Exception:
+        with _jobs_lock:
+            _jobs_in_flight -= 1
+        raise
+    future.add_done_callback(partial(_job_finished, job_id))
+    return job_id
+
+def is_valid_id(value):
+    # Job and build ids are uuid4 hex strings; anything else never touches disk.
+    return len(value) == 32 and all(c in "0123456789abcdef" for c in value)
+
+# --- Persisted Builds ---
+
+BUILD_DIR = os.environ.get("BUILD_DIR", os.path.join(tempfile.gettempdir(), "ebook-builds"))
+# Builds not created or rebuilt within this long are removed.
+BUILD_TTL_SECONDS = int(os.environ.get("BUILD_TTL_SECONDS", 7 * 24 * 3600))
+
+class InvalidRebuild(Exception):
+    """A rebuild request doesn't fit the stored build."""
+
+class BuildNotFound(Exception):
+    """The build doesn't exist, or was pruned while a request waited on it."""
+
+def build_path(build_id, *parts):
+    return os.path.join(BUILD_DIR, build_id, *parts)
+
+def read_build_manifest(build_id):
+    try:
+        with open(build_path(build_id, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_build_manifest(build_id, manifest):
+    fd, tmp_path = tempfile.mkstemp(dir=build_path(build_id), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, build_path(build_id, "manifest.json"))
+
+@contextmanager
+def locked_build(build_id):
+    """Hold the build's lock and yield its manifest, read under the lock.
+
+    Raises BuildNotFound if the build is gone, including when prune_builds
+    removed it while this was waiting for the lock.
+    """
+    try:
+        lock_file = open(build_path(build_id, ".lock"), "w")
+    except FileNotFoundError:
+        raise BuildNotFound(build_id) from None
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        manifest = read_build_manifest(build_id)
+        if manifest is None:
+            raise BuildNotFound(build_id)
+        yield manifest
+
+def prune_builds():
+    """Remove builds idle for longer than BUILD_TTL_SECONDS.
+
+    A build being rebuilt holds its lock and is skipped. A directory
+    without a manifest is a build still being created, or one left by a
+    crash, and ages by its mtime.
+    """
+    if not os.path.isdir(BUILD_DIR):
+        return
+    cutoff = time.time() - BUILD_TTL_SECONDS
+    for entry in os.scandir(BUILD_DIR):
+        if not entry.is_dir() or not is_valid_id(entry.name):
+            continue
+        try:
+            manifest = read_build_manifest(entry.name)
+            last_used = manifest["updated_at"] if manifest else entry.stat().st_mtime
+            if last_used >= cutoff:
+                continue
+            with open(build_path(entry.name, ".lock"), "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except (FileNotFoundError, ValueError):
+            pass
+
+def create_build(book_config, chapters, options, on_preflight=None):
+    """Build a book into its own build directory and record how it was made.
+
+    The manifest keeps the config and each chapter's page range in the
+    output, which is all a later rebuild needs to reuse the unchanged pages.
+    A failed build leaves nothing behind.
+    """
+    prune_builds()
+    build_id = uuid.uuid4().hex
+    os.makedirs(build_path(build_id))
+    try:
+        stats = build_book(
+            book_config, chapters, build_path(build_id, "book.pdf"), options=options, on_preflight=on_preflight
+        )
+        now = time.time()
+        manifest = {
+            "build_id": build_id,
+            "version": 1,
+            "config": book_config,
+            "options": options,
+            "chapters": stats["chapters"],
+            "pages": stats["pages"],
+            "bytes": stats["bytes_out"],
+            "created_at": now,
+            "updated_at": now,
+        }
+        write_build_manifest(build_id, manifest)
+    except BaseException:
+        shutil.rmtree(build_path(build_id), ignore_errors=True)
+        raise
+    return manifest, stats
+
+def rebuild_book(build_id, data, files, work_dir, on_preflight=None):
+    """Apply the changed parts in ``data``/``files`` to a stored build.
+
+    Only fields present in the request change. ``chapter_<i>`` uploads
+    replace (or, past the old count, append) chapters and are the only PDFs
+    parsed; every other chapter's pages are copied straight from the
+    previous book. ``chapter_count`` can drop trailing chapters.
+    ``on_preflight`` receives the new book's chapter page counts.
+    """
+    with locked_build(build_id) as manifest:
+        book_config = dict(manifest["config"])
+        book_config.update({k: data[k] for k in BOOK_CONFIG_FIELDS if k in data})
+        if 'author_image' in files:
+            book_config['bio_img_url'] = author_image_url(files['author_image'].read())
+        options = dict(manifest["options"])
+        options.update((k, v) for k, v in book_options_from_request(data).items() if k in data)
+
+        prior_chapters = manifest["chapters"]
+        try:
+            chapter_count = int(data.get("chapter_count", len(prior_chapters)))
+        except ValueError:
+            raise InvalidRebuild("chapter_count must be an integer")
+        uploads = []
+        plan = []
+        for i in range(chapter_count):
+            default_title = prior_chapters[i]["title"] if i < len(prior_chapters) else f"Chapter {i+1}"
+            title = data.get(f"chapter_{i}_title", default_title)
+            if f"chapter_{i}" in files:
+                path = os.path.join(work_dir, f"chapter_{i}.pdf")
+                files[f"chapter_{i}"].save(path)
+                plan.append((title, len(uploads), None))
+                uploads.append((title, path))
+            elif i < len(prior_chapters):
+                plan.append((title, None, prior_chapters[i]))
+            else:
+                raise InvalidRebuild(f"chapter_{i} is new and needs a file")
+
+        timings = StageTimings()
+        tmp_output = build_path(build_id, "book.pdf.tmp")
+        with ExitStack() as stack:
+            prior_book = PdfReader(stack.enter_context(open(build_path(build_id, "book.pdf"), "rb")))
+            with timings.stage("preflight"):
+                _, uploaded_pdfs = finish_preflight(uploads, start_preflight(uploads), stack)
+
+            items = []
+            toc_data = []
+            current_page_counter = 4
+            for title, upload_index, prior in plan:
+                if prior is None:
+                    pages = uploaded_pdfs[upload_index]["pages"]
+                else:
+                    pages = [prior_book.pages[k] for k in range(prior["start"], prior["start"] + prior["pages"])]
+                toc_data.append({"title": title, "page": to_bangla_num(current_page_counter)})
+                items.append({"title": title, "pages": pages})
+                current_page_counter += len(pages)
+            check_book_pages(sum(len(item["pages"]) for item in items))
+            if on_preflight:
+                on_preflight([len(item["pages"]) for item in items])
+
+            render_config = dict(book_config, toc_list=toc_data)
+            with timings.stage("qr"):
+                render_config['qr_code'] = generate_qr_base64(render_config['group_link'])
+            bytes_in = sum(os.path.getsize(path) for _, path in uploads)
+            stats = assemble_book(
+                render_config, {}, items, tmp_output, options, timings, lambda stage: None, bytes_in
+            )
+        os.replace(tmp_output, build_path(build_id, "book.pdf"))
+
+        manifest.update(
+            version=manifest["version"] + 1,
+            config=book_config,
+            options=options,
+            chapters=stats["chapters"],
+            pages=stats["pages"],
+            bytes=stats["bytes_out"],
+            updated_at=time.time(),
+        )
+        write_build_manifest(build_id, manifest)
+        stats["reused_chapters"] = sum(1 for _, _, prior in plan if prior is not None)
+        return manifest, stats
+
+def send_stored_book(build_id, as_attachment=False):
+    """Serve a build's book with Range, ETag and conditional GET support.
+
+    The file is opened once and the ETag, size and Last-Modified come from
+    that handle, so they always describe the bytes sent even if a rebuild
+    replaces book.pdf meanwhile. A rebuild writes a new file, so the ETag
+    changes and an If-Range for the old one falls back to the full file.
+    """
+    f = open(build_path(build_id, "book.pdf"), "rb")
+    try:
+        st = os.fstat(f.fileno())
+        response = send_file(
+            f,
+            as_attachment=as_attachment,
+            download_name="Full_Customized_Book.pdf",
+            mimetype='application/pdf',
+            etag=f"{build_id}-{st.st_ino:x}-{st.st_mtime_ns:x}",
+            last_modified=st.st_mtime,
+            conditional=False,
+        )
+        response.content_length = st.st_size
+        return response.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
+    except BaseException:
+        f.close()
+        raise
+
+def build_summary(manifest):
+    config = dict(manifest["config"])
+    if config.get("bio_img_url", "").startswith("data:"):
+        config["bio_img_url"] = "(uploaded image)"
+    return dict(
+        manifest,
+        config=config,
+        book_url=f"/api/builds/{manifest['build_id']}/book.pdf",
+    )
+
+# --- Startup Warm-up ---
+
+# With gunicorn's preload_app the master warms up once before forking, so
+# every worker starts with fonts, the parsed stylesheet and the compiled
+# templates already in memory (see gunicorn.conf.py).
+warm_state = {"ready": False, "warming": False, "pid": None, "timings_ms": {}, "error": None}
+_warm_lock = threading.Lock()
+
+def warm_up():
+    """Pay the one-time render costs: fontconfig, stylesheet, QR and a
+    throwaway render of every template page that bypasses the page cache."""
+    if missing_font_files and REQUIRE_BUNDLED_FONTS:
+        raise RuntimeError("Missing bundled fonts: " + ", ".join(missing_font_files))
+
+    timings = StageTimings()
+    with timings.stage("render_context"):
+        get_render_context()
+
+    book_config = book_config_from_request({}, {})
+    with timings.stage("qr"):
+        book_config['qr_code'] = generate_qr_base64(book_config['group_link'])
+    book_config['toc_list'] = [{"title": "Warm-up", "page": to_bangla_num(4)}]
+
+    with timings.stage("weasyprint"):
+        rendered = [render_pdf(page_templates[page].render(**book_config)) for page in TEMPLATE_PAGES]
+
+    with timings.stage("pypdf"):
+        writer = PdfWriter()
+        for pdf_bytes in rendered:
+            writer.add_page(PdfReader(io.BytesIO(pdf_bytes)).pages[0])
+        writer.write(_CountingSink())
+    return timings
+
+def ensure_warm():
+    with _warm_lock:
+        if warm_state["ready"] or warm_state["warming"]:
+            return
+        warm_state["warming"] = True
+
+    started = time.perf_counter()
+    try:
+        timings = warm_up()
+        warm_state.update(ready=True, error=None, timings_ms=dict(
+            timings.as_ms(), total=round((time.perf_counter() - started) * 1000, 1)
+        ))
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        warm_state["error"] = str(e)
+    finally:
+        warm_state.update(warming=False, pid=os.getpid())
+    logger.info(json.dumps({"event": "warm_up", "startup_ms": startup_ms, **warm_state}))
+
+def start_warm_up():
+    threading.Thread(target=ensure_warm, name="warm-up", daemon=True).start()
+
+# --- Main Logic ---
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+@app.after_request
+def finish_request_metrics(response):
+    endpoint = request.endpoint or "unknown"
+    duration = time.perf_counter() - g.request_started
+    REQUESTS.labels(endpoint, response.status_code).inc()
+    REQUEST_LATENCY.labels(endpoint).observe(duration)
+
+    log_line = {
+        "event": "request",
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 1),
+        "bytes_in": request.content_length or 0,
+    }
+    stats = g.get("build_stats")
+    if stats:
+        log_line.update(
+            timings_ms=stats["timings_ms"],
+            pages=stats["pages"],
+            bytes_out=stats["bytes_out"],
+            counters=stats["counters"],
+        )
+    for name in ("author_image", "qr_code"):
+        if g.get(name):
+            log_line[name] = g.get(name)
+    logger.info(json.dumps(log_line, ensure_ascii=False))
+    return response
+
+@app.teardown_request
+def release_in_flight(exc):
+    IN_FLIGHT.dec()
+
+def metrics_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return generate_latest(metrics_registry()), 200, {"Content-Type": CONTENT_TYPE_LATEST}
+
+@app.route('/api/generate', methods=['POST'])
+@admission_controlled
+def generate_book():
+    reset_peak_rss()
+    work_dir = tempfile.mkdtemp(prefix="ebook-", dir=SPOOL_DIR)
+    try:
+        book_config = book_config_from_request(request.form, request.files)
+        chapters = spool_chapters(chapters_from_request(request.form, request.files), work_dir)
+        options = book_options_from_request(request.form)
+
+        if form_flag(request.form, "store"):
+            # Keep the book as a build so it can be fetched again, with
+            # Range and conditional requests, from a stable URL.
+            manifest, stats = create_build(book_config, chapters, options, on_preflight=g.on_preflight)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            response = send_stored_book(manifest["build_id"], as_attachment=True)
+            response.headers["Content-Location"] = build_summary(manifest)["book_url"]
+            response.headers["X-Build-Id"] = manifest["build_id"]
+        else:
+            output_path = os.path.join(work_dir, "book.pdf")
+            stats = build_book(book_config, chapters, output_path, options=options, on_preflight=g.on_preflight)
+
+            # send_file streams the file in chunks; the spool directory goes
+            # away once the response has been fully sent.
+            response = send_file(
+                output_path,
+                as_attachment=True,
+                download_name="Full_Customized_Book.pdf",
+                mimetype='application/pdf'
+            )
+            response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+        g.build_stats = stats
+        response.headers["Server-Timing"] = server_timing_header(stats["timings_ms"])
+        response.headers["X-Peak-RSS-KB"] = str(peak_rss_kb())
+        if "optimization" in stats:
+            optimization = stats["optimization"]
+            response.headers["X-Size-Before"] = str(optimization["bytes_before"])
+            response.headers["X-Size-After"] = str(optimization["bytes_after"])
+            response.headers["X-Optimize-Timings"] = ", ".join(
+                f"{step}={ms}ms" for step, ms in optimization["timings_ms"].items()
+            )
+        inline_image_headers(response)
+        return response
+
+    except InvalidOptions as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({"error": str(e)}), 400
+    except (ChapterError, BookTooLarge) as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return e.to_response()
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        logger.exception("Book generation failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/batch', methods=['POST'])
+@admission_controlled
+def generate_batch():
+    reset_peak_rss()
+    work_dir = tempfile.mkdtemp(prefix="ebook-batch-", dir=SPOOL_DIR)
+    try:
+        base_config = book_config_from_request(request.form, request.files)
+        names, variant_configs = variant_configs_from_request(base_config, request.form, request.files)
+        chapters = spool_chapters(chapters_from_request(request.form, request.files), work_dir)
+        options = book_options_from_request(request.form)
+
+        outputs = [os.path.join(work_dir, name) for name in names]
+        all_stats = build_book_variants(
+            variant_configs, chapters, outputs, options=options, on_preflight=g.on_preflight
+        )
+
+        zip_path = os.path.join(work_dir, "books.zip")
+        # PDFs are already compressed, so store them as-is.
+        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as archive:
+            for name, output in zip(names, outputs):
+                archive.write(output, arcname=name)
+                os.remove(output)
+            manifest = [dict(stats, file=name) for name, stats in zip(names, all_stats)]
+            archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+
+        timings_ms = {}
+        counters = {}
+        for stats in all_stats:
+            for stage, ms in stats["timings_ms"].items():
+                timings_ms[stage] = round(timings_ms.get(stage, 0) + ms, 1)
+            for name, n in stats["counters"].items():
+                counters[name] = counters.get(name, 0) + n
+        g.build_stats = {
+            "timings_ms": timings_ms,
+            "pages": sum(stats["pages"] for stats in all_stats),
+            "bytes_out": sum(stats["bytes_out"] for stats in all_stats),
+            "counters": counters,
+        }
+
+        response = send_file(
+            zip_path,
+            as_attachment=True,
+            download_name="Customized_Books.zip",
+            mimetype='application/zip'
+        )
+        response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+        response.headers["Server-Timing"] = server_timing_header(timings_ms)
+        response.headers["X-Peak-RSS-KB"] = str(peak_rss_kb())
+        response.headers["X-Variant-Count"] = str(len(names))
+        return response
+
+    except (InvalidVariants, InvalidOptions) as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({"error": str(e)}), 400
+    except (ChapterError, BookTooLarge) as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return e.to_response()
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        logger.exception("Batch generation failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/preview/<page>', methods=['GET', 'POST'])
+def preview_page(page):
+    if page not in TEMPLATE_PAGES:
+        return jsonify({"error": f"Unknown page, expected one of: {', '.join(TEMPLATE_PAGES)}"}), 404
+    data = request.values
+    output_format = data.get("format", "png")
+    if output_format not in ("png", "pdf"):
+        return jsonify({"error": "format must be 'png' or 'pdf'"}), 400
+    try:
+        dpi = min(max(int(data.get("dpi", PREVIEW_DPI)), 12), PREVIEW_MAX_DPI)
+        toc_data = preview_toc_from_request(data) if page == "index" else None
+    except ValueError:
+        return jsonify({"error": "dpi, chapter_count and chapter_<i>_pages must be integers"}), 400
+    except RequestRejected as e:
+        return e.to_response()
+
+    try:
+        book_config = book_config_from_request(data, request.files)
+        if page == "back_cover":
+            book_config['qr_code'] = generate_qr_base64(book_config['group_link'])
+        if page == "index":
+            book_config['toc_list'] = toc_data
+
+        if output_format == "png":
+            key, body = render_preview_png(page, book_config, dpi)
+            mimetype = "image/png"
+        else:
+            key, body = page_cache_key(page, book_config), render_template_pdf(page, book_config)
+            mimetype = "application/pdf"
+
+        response = app.response_class(body, mimetype=mimetype)
+        response.set_etag(key)
+        response.headers["Cache-Control"] = "private, max-age=300"
+        return response.make_conditional(request)
+
+    except Exception as e:
+        logger.exception("Preview failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    # The same per-request limits apply; the budget is reserved by the
+    # pool process once the job actually starts (see run_book_job).
+    try:
+        check_request_limits()
+    except RequestRejected as e:
+        return e.to_response()
+
+    try:
+        book_config = book_config_from_request(request.form, request.files)
+        chapters = chapters_from_request(request.form, request.files)
+
+        options = book_options_from_request(request.form)
+
+        job_id = submit_book_job(book_config, chapters, options)
+        if job_id is None:
+            response = jsonify({"error": "Job queue is full, try again shortly"})
+            response.headers["Retry-After"] = "5"
+            return response, 503
+
+        return jsonify({
+            "job_id": job_id,
+            "status_url": f"/api/jobs/{job_id}",
+            "result_url": f"/api/jobs/{job_id}/result",
+        }), 202
+
+    except InvalidOptions as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Book generation failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = read_job_status(job_id) if is_valid_id(job_id) else None
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    status = read_job_status(job_id) if is_valid_id(job_id) else None
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if status["status"] != "done":
+        return jsonify({"error": f"Job is {status['status']}", "status": status}), 409
+    # A finished job's book never changes, so its id is a safe ETag.
+    return send_file(
+        job_path(job_id, "book.pdf"),
+        as_attachment=True,
+        download_name="Full_Customized_Book.pdf",
+        mimetype='application/pdf',
+        etag=job_id,
+        conditional=True,
+    )
+
+@app.route('/api/builds', methods=['POST'])
+@admission_controlled
+def create_build_route():
+    work_dir = tempfile.mkdtemp(prefix="ebook-", dir=SPOOL_DIR)
+    try:
+        book_config = book_config_from_request(request.form, request.files)
+        chapters = spool_chapters(chapters_from_request(request.form, request.files), work_dir)
+        options = book_options_from_request(request.form)
+
+        manifest, stats = create_build(book_config, chapters, options, on_preflight=g.on_preflight)
+        g.build_stats = stats
+        response = jsonify(build_summary(manifest))
+        response.headers["Server-Timing"] = server_timing_header(stats["timings_ms"])
+        return response, 201
+
+    except InvalidOptions as e:
+        return jsonify({"error": str(e)}), 400
+    except (ChapterError, BookTooLarge) as e:
+        return e.to_response()
+    except Exception as e:
+        logger.exception("Build failed")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+@app.route('/api/builds/<build_id>', methods=['GET'])
+def build_info(build_id):
+    manifest = read_build_manifest(build_id) if is_valid_id(build_id) else None
+    if manifest is None:
+        return jsonify({"error": "Unknown build"}), 404
+    return jsonify(build_summary(manifest))
+
+@app.route('/api/builds/<build_id>/rebuild', methods=['POST'])
+@admission_controlled
+def rebuild_route(build_id):
+    if not is_valid_id(build_id) or read_build_manifest(build_id) is None:
+        return jsonify({"error": "Unknown build"}), 404
+    work_dir = tempfile.mkdtemp(prefix="ebook-", dir=SPOOL_DIR)
+    try:
+        manifest, stats = rebuild_book(build_id, request.form, request.files, work_dir, on_preflight=g.on_preflight)
+        g.build_stats = stats
+        response = jsonify(dict(build_summary(manifest), reused_chapters=stats["reused_chapters"]))
+        response.headers["Server-Timing"] = server_timing_header(stats["timings_ms"])
+        return response
+
+    except BuildNotFound:
+        return jsonify({"error": "Unknown build"}), 404
+    except (InvalidRebuild, InvalidOptions) as e:
+        return jsonify({"error": str(e)}), 400
+    except (ChapterError, BookTooLarge) as e:
+        return e.to_response()
+    except Exception as e:
+        logger.exception("Rebuild failed")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+@app.route('/api/builds/<build_id>/book.pdf', methods=['GET'])
+def build_book_file(build_id):
+    if not is_valid_id(build_id) or read_build_manifest(build_id) is None:
+        return jsonify({"error": "Unknown build"}), 404
+    try:
+        return send_stored_book(build_id)
+    except FileNotFoundError:
+        # Pruned between the manifest check and the open.
+        return jsonify({"error": "Unknown build"}), 404
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    # page_cache.stats() only counts this worker's lookups; the metrics add
+    # up every worker and job process.
+    registry = metrics_registry()
+    stats = page_cache.stats()
+    stats["lookups_all_processes"] = {
+        kind: {
+            key: int(registry.get_sample_value(
+                "ebook_page_cache_lookups_total", {"kind": kind, "result": result}
+            ) or 0)
+            for key, result in (("hits", "hit"), ("misses", "miss"))
+        }
+        for kind in PAGE_CACHE_KINDS.values()
+    }
+    return jsonify(stats)
+
+@app.route('/api/admission', methods=['GET'])
+def admission_stats():
+    return jsonify({
+        **admission.stats(),
+        "limits": {
+            "max_request_bytes": MAX_REQUEST_BYTES,
+            "max_upload_bytes": MAX_UPLOAD_BYTES,
+            "max_chapters": MAX_CHAPTERS,
+            "max_chapter_pages": MAX_CHAPTER_PAGES,
+            "max_book_pages": MAX_BOOK_PAGES,
+        },
+    })
+
+@app.route('/api/assets', methods=['GET'])
+def asset_stats():
+    return jsonify({
+        "assets": sorted(asset_store),
+        "missing_fonts": missing_font_files,
+        "network_policy": RENDER_NETWORK_POLICY,
+        "external_fetches": external_fetches,
+    })
+
+@app.route('/healthz/live', methods=['GET'])
+def liveness():
+    return jsonify({"status": "ok"})
+
+@app.route('/healthz/ready', methods=['GET'])
+def readiness():
+    body = dict(warm_state, startup_ms=startup_ms, worker_pid=os.getpid())
+    return jsonify(body), 200 if warm_state["ready"] else 503
+
+startup_ms = {"import": round((time.perf_counter() - _import_started) * 1000, 1)}
+
+if __name__ == "__main__":
+    ensure_warm()
+    port = int(os.environ.get("PORT", 5000))
+    app.run(host='0.0.0.0', port=port)
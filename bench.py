@@ -0,0 +1,337 @@
+"""Benchmark the book generation pipeline end to end, fully offline.
+
+    python bench.py --chapters 30 --pages-per-chapter 10 --concurrency 4 --requests 20 \
+        --output results.json --compare baseline.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import base64
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Renders must stay hermetic; all of these are read when backend is imported.
+os.environ.setdefault("RENDER_NETWORK_POLICY", "block")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# Each request would otherwise reset VmHWM, leaving ru_maxrss as the last
+# request's peak, and concurrent requests would reset each other's.
+os.environ["PEAK_RSS_RESET"] = "0"
+
+BENGALI_WORDS = (
+    "রাজ্য", "ক্ষমতা", "নেতৃত্ব", "রাজনীতি", "ইতিহাস", "মানুষ", "শাসক", "প্রজা",
+    "যুদ্ধ", "শান্তি", "বুদ্ধি", "ভাগ্য", "সাহস", "নীতি", "সমাজ", "স্বাধীনতা",
+)
+
+chapter_template_str = """
+<!DOCTYPE html>
+<html lang="bn">
+<head>
+    <meta charset="UTF-8">
+    <style>
+        @page {{ size: {page_size}; margin: 20mm; }}
+        body {{ font-family: 'Noto Serif Bengali', serif; font-size: 12pt; line-height: 1.7; }}
+        h1 {{ font-size: 20pt; margin-bottom: 12pt; }}
+        img {{ width: 100%; margin: 12pt 0; }}
+        section {{ page-break-after: always; }}
+    </style>
+</head>
+<body>{body}</body>
+</html>
+"""
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def synthetic_jpeg(rng, size, quality=90):
+    from PIL import Image
+
+    image = Image.effect_noise(size, rng.randint(20, 80)).convert("RGB")
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+def synthetic_image_uri(rng, size):
+    return "data:image/jpeg;base64," + base64.b64encode(synthetic_jpeg(rng, size)).decode()
+
+def build_chapter_pdf(backend, rng, index, pages, page_size, image_px):
+    sections = []
+    for page in range(pages):
+        paragraphs = "".join(
+            "<p>" + " ".join(rng.choice(BENGALI_WORDS) for _ in range(60)) + "</p>"
+            for _ in range(4)
+        )
+        image = f'<img src="{synthetic_image_uri(rng, image_px)}">' if page % 2 == 0 else ""
+        sections.append(f"<section><h1>অধ্যায় {index + 1}.{page + 1}</h1>{image}{paragraphs}</section>")
+    html = chapter_template_str.format(page_size=page_size, body="".join(sections))
+    return backend.HTML(string=html, url_fetcher=backend.asset_url_fetcher).write_pdf()
+
+def build_chapters(rng_state, count, pages, page_size, image_px):
+    """Render the synthetic chapters; returns them and the rng state to
+    carry on from. Runs in a child process so the memory WeasyPrint uses to
+    make them doesn't count towards the benchmark's peak RSS."""
+    import backend
+
+    rng = random.Random()
+    rng.setstate(rng_state)
+    chapters = [build_chapter_pdf(backend, rng, i, pages, page_size, image_px) for i in range(count)]
+    return chapters, rng.getstate()
+
+def legacy_qr_png_uri(data):
+    """The QR code as every request used to make it: a 10px-per-module PNG."""
+    import qrcode
+
+    qr = qrcode.QRCode(box_size=10, border=0)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffered = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffered, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffered.getvalue()).decode()
+
+def measure_qr_code(backend):
+    """Make the default link's QR code as now (SVG) and as before (PNG) and
+    render the back cover with each: the cost to make it, the inlined URI
+    and what the page comes to in the PDF."""
+    book_config = backend.book_config_from_request({}, {})
+    measured = {}
+    for name, make in (("svg", backend._qr_svg_uri.__wrapped__), ("png", legacy_qr_png_uri)):
+        started = time.perf_counter()
+        uri = make(book_config["group_link"])
+        ms = (time.perf_counter() - started) * 1000
+        html = backend.page_templates["back_cover"].render(**dict(book_config, qr_code=uri, toc_list=[]))
+        measured[name] = {"ms": round(ms, 1), "uri_bytes": len(uri), "page_bytes": len(backend.render_pdf(html))}
+    return measured
+
+def build_request_data(chapters, optimize, author_image=None):
+    data = {"chapter_count": str(len(chapters))}
+    if author_image:
+        data["author_image"] = (io.BytesIO(author_image), "author.jpg")
+    for i, pdf_bytes in enumerate(chapters):
+        data[f"chapter_{i}"] = (io.BytesIO(pdf_bytes), f"chapter_{i}.pdf")
+        data[f"chapter_{i}_title"] = f"অধ্যায় {i + 1}"
+    if optimize:
+        data["optimize"] = "1"
+    return data
+
+def parse_server_timing(header):
+    timings = {}
+    for part in filter(None, (p.strip() for p in header.split(","))):
+        name, _, dur = part.partition(";dur=")
+        if dur:
+            timings[name] = float(dur)
+    return timings
+
+def run_request(client, chapters, optimize, author_image=None):
+    started = time.perf_counter()
+    response = client.post(
+        "/api/generate",
+        data=build_request_data(chapters, optimize, author_image),
+        content_type="multipart/form-data",
+    )
+    body = response.get_data()
+    elapsed = time.perf_counter() - started
+    result = {
+        "status": response.status_code,
+        "latency_s": elapsed,
+        "bytes_out": len(body),
+        "stages_ms": parse_server_timing(response.headers.get("Server-Timing", "")),
+    }
+    response.close()
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def summarize(args, results, wall_s, qr_code):
+    ok = [r for r in results if r["status"] == 200]
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    latencies = [r["latency_s"] for r in ok]
+    stages = {}
+    for r in ok:
+        for name, ms in r["stages_ms"].items():
+            stages.setdefault(name, []).append(ms)
+    return {
+        "config": {
+            "chapters": args.chapters,
+            "pages_per_chapter": args.pages_per_chapter,
+            "page_size": args.page_size,
+            "image_px": list(args.image_px),
+            "author_image_px": list(args.author_image_px) if args.author_image_px else None,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "optimize": args.optimize,
+            "page_cache": not args.no_cache,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            # Preflight runs on a process pool, so its timing scales with this.
+            "cpus": os.cpu_count(),
+            "revision": git_revision(),
+        },
+        "requests_ok": len(ok),
+        "requests_failed": len(results) - len(ok),
+        "statuses": statuses,
+        "latency_s": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        },
+        "throughput_rps": len(ok) / wall_s if wall_s else 0.0,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "output_bytes": max((r["bytes_out"] for r in ok), default=0),
+        "stages_ms": {name: sum(v) / len(v) for name, v in sorted(stages.items())},
+        "qr_code": qr_code,
+    }
+
+# Metrics where a higher number is worse, compared against the baseline.
+REGRESSION_METRICS = (
+    ("latency_s", "p50"),
+    ("latency_s", "p95"),
+    ("latency_s", "p99"),
+    ("peak_rss_kb",),
+    ("output_bytes",),
+)
+
+def lookup(summary, path):
+    value = summary
+    for key in path:
+        value = value[key]
+    return value
+
+class IncomparableBaseline(Exception):
+    """The baseline was measured with different benchmark settings."""
+
+def compare(summary, baseline, threshold):
+    if baseline["config"] != summary["config"]:
+        differing = sorted(
+            key for key in set(baseline["config"]) | set(summary["config"])
+            if baseline["config"].get(key) != summary["config"].get(key)
+        )
+        raise IncomparableBaseline("baseline config differs in: " + ", ".join(differing))
+    regressions = []
+    for path in REGRESSION_METRICS:
+        before, after = lookup(baseline, path), lookup(summary, path)
+        if before and (after - before) / before > threshold:
+            regressions.append({"metric": ".".join(path), "baseline": before, "current": after})
+    if baseline["throughput_rps"] and summary["throughput_rps"] < baseline["throughput_rps"] * (1 - threshold):
+        regressions.append({
+            "metric": "throughput_rps",
+            "baseline": baseline["throughput_rps"],
+            "current": summary["throughput_rps"],
+        })
+    return regressions
+
+def print_report(summary):
+    latency = summary["latency_s"]
+    print(f"requests: {summary['requests_ok']} ok, {summary['requests_failed']} failed")
+    if summary["requests_failed"]:
+        print("statuses: " + ", ".join(f"{status}={n}" for status, n in sorted(summary["statuses"].items())))
+    print(f"latency:  p50={latency['p50']:.3f}s  p95={latency['p95']:.3f}s  p99={latency['p99']:.3f}s")
+    print(f"throughput: {summary['throughput_rps']:.2f} req/s")
+    print(f"peak rss: {summary['peak_rss_kb']} KB")
+    print(f"output: {summary['output_bytes']} bytes")
+    for name, ms in summary["stages_ms"].items():
+        print(f"  {name:<12} {ms:9.1f} ms")
+    for name, qr in summary["qr_code"].items():
+        print(f"qr {name}: {qr['ms']} ms to make, {qr['uri_bytes']} bytes inlined, "
+              f"back cover {qr['page_bytes']} bytes")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=10)
+    parser.add_argument("--pages-per-chapter", type=int, default=5)
+    parser.add_argument("--page-size", default="A4", help="CSS page size for synthetic chapters")
+    parser.add_argument("--image-px", type=int, nargs=2, default=(1200, 800), metavar=("W", "H"))
+    parser.add_argument("--author-image-px", type=int, nargs=2, metavar=("W", "H"),
+                        help="upload a synthetic author photo of this size with every request")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed requests before measuring")
+    parser.add_argument("--optimize", action="store_true", help="request optimize mode")
+    parser.add_argument("--no-cache", action="store_true", help="disable the template page cache")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON summary here")
+    parser.add_argument("--compare", help="baseline JSON summary to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    if "PAGE_CACHE_DIR" not in os.environ:
+        os.environ["PAGE_CACHE_DIR"] = tempfile.mkdtemp(prefix="ebook-bench-cache-")
+    # A private admission ledger, so a server running on the same machine
+    # can't throttle the benchmark.
+    if "ADMISSION_DIR" not in os.environ:
+        os.environ["ADMISSION_DIR"] = tempfile.mkdtemp(prefix="ebook-bench-admission-")
+    if args.no_cache:
+        os.environ["PAGE_CACHE_MAX_BYTES"] = "0"
+
+    import backend
+
+    rng = random.Random(args.seed)
+    print(f"building {args.chapters} synthetic chapters x {args.pages_per_chapter} pages...")
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        chapters, rng_state = pool.submit(
+            build_chapters, rng.getstate(), args.chapters, args.pages_per_chapter, args.page_size,
+            tuple(args.image_px),
+        ).result()
+    rng.setstate(rng_state)
+
+    author_image = synthetic_jpeg(rng, tuple(args.author_image_px), quality=95) if args.author_image_px else None
+
+    client = backend.app.test_client()
+    for _ in range(args.warmup):
+        run_request(client, chapters, args.optimize, author_image)
+
+    def worker(_):
+        return run_request(backend.app.test_client(), chapters, args.optimize, author_image)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(worker, range(args.requests)))
+    wall_s = time.perf_counter() - started
+
+    summary = summarize(args, results, wall_s, measure_qr_code(backend))
+    print_report(summary)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(summary, baseline, args.threshold)
+        except IncomparableBaseline as e:
+            print(f"cannot compare: {e}")
+            return 2
+        for r in regressions:
+            print(f"REGRESSION {r['metric']}: {r['baseline']} -> {r['current']}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
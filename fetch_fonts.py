@@ -0,0 +1,135 @@
+"""Fetch the OFL fonts listed in backend.FONT_FACES into ASSET_DIR/fonts.
+
+    python fetch_fonts.py
+    python fetch_fonts.py --lock <google/fonts commit>
+
+Google Fonts only publishes these families as variable fonts, so each
+static weight is cut from the variable font with fontTools (a WeasyPrint
+dependency). Run during the Docker build; the app refuses to start while
+any of the files are missing.
+
+Sources are pinned in fonts.lock: a google/fonts commit and the sha256 of
+every file fetched from it. A download that doesn't match fails the build.
+``--lock`` downloads the sources at the given commit and rewrites the lock
+file; review and commit the result.
+"""
+import os
+import sys
+import json
+import hashlib
+import logging
+import tempfile
+import urllib.parse
+import urllib.request
+
+from fontTools.ttLib import TTFont
+from fontTools.varLib.instancer import instantiateVariableFont
+
+# backend warns about the very fonts this script is about to fetch.
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from backend import ASSET_DIR, FONT_FACES
+
+logging.getLogger("fontTools").setLevel(logging.WARNING)
+
+GOOGLE_FONTS_BASE = os.environ.get("GOOGLE_FONTS_BASE", "https://raw.githubusercontent.com/google/fonts/{commit}/")
+FONT_LOCK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts.lock")
+
+# Variable font and licence for each family, relative to the pinned commit.
+FONT_SOURCES = {
+    "Noto Serif Bengali": ("ofl/notoserifbengali/NotoSerifBengali[wdth,wght].ttf", "ofl/notoserifbengali/OFL.txt"),
+    "Cormorant Garamond": ("ofl/cormorantgaramond/CormorantGaramond[wght].ttf", "ofl/cormorantgaramond/OFL.txt"),
+    "Crimson Pro": ("ofl/crimsonpro/CrimsonPro[wght].ttf", "ofl/crimsonpro/OFL.txt"),
+    "Inter": ("ofl/inter/Inter[opsz,wght].ttf", "ofl/inter/OFL.txt"),
+}
+
+class LockMismatch(Exception):
+    pass
+
+def read_lock():
+    with open(FONT_LOCK_FILE) as f:
+        return json.load(f)
+
+def write_lock(lock):
+    with open(FONT_LOCK_FILE, "w") as f:
+        json.dump(lock, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def download(commit, path, target):
+    """Fetch ``path`` at ``commit`` into ``target``; returns its sha256."""
+    base = GOOGLE_FONTS_BASE.format(commit=commit)
+    url = urllib.parse.urljoin(base, urllib.parse.quote(path))
+    with urllib.request.urlopen(url, timeout=60) as response:
+        data = response.read()
+    with open(target, "wb") as f:
+        f.write(data)
+    return hashlib.sha256(data).hexdigest()
+
+def verified_download(lock, path, target):
+    expected = lock["sha256"].get(path)
+    if not expected:
+        raise LockMismatch(f"{path} is not pinned in fonts.lock")
+    digest = download(lock["commit"], path, target)
+    if digest != expected:
+        os.remove(target)
+        raise LockMismatch(f"{path}: sha256 {digest}, fonts.lock expects {expected}")
+
+def static_instance(variable_path, weight, output_path):
+    """Pin every axis of the variable font (wght to ``weight``, the rest to
+    their defaults) and save the result as a static TTF."""
+    with TTFont(variable_path) as font:
+        location = {
+            axis.axisTag: weight if axis.axisTag == "wght" else axis.defaultValue
+            for axis in font["fvar"].axes
+        }
+        instance = instantiateVariableFont(font, location)
+        instance.save(output_path)
+
+def lock(commit):
+    """Pin ``commit`` and record the sha256 of every source file at it."""
+    hashes = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for paths in FONT_SOURCES.values():
+            for path in paths:
+                print(f"hashing {path}...")
+                hashes[path] = download(commit, path, os.path.join(tmp, "source"))
+    write_lock({"commit": commit, "sha256": hashes})
+    return 0
+
+def main(argv):
+    if len(argv) == 2 and argv[0] == "--lock":
+        return lock(argv[1])
+    if argv:
+        print(__doc__, file=sys.stderr)
+        return 2
+
+    pins = read_lock()
+    if not pins.get("commit"):
+        print("fonts.lock pins no google/fonts commit; run fetch_fonts.py --lock <commit>", file=sys.stderr)
+        return 1
+    font_dir = os.path.join(ASSET_DIR, "fonts")
+    os.makedirs(font_dir, exist_ok=True)
+    for family, (font_path, license_path) in FONT_SOURCES.items():
+        faces = [(weight, path) for name, weight, path in FONT_FACES if name == family]
+        variable_path = os.path.join(font_dir, os.path.basename(font_path))
+        print(f"fetching {family}...")
+        try:
+            verified_download(pins, license_path, os.path.join(font_dir, family.replace(" ", "") + "-OFL.txt"))
+            verified_download(pins, font_path, variable_path)
+        except LockMismatch as e:
+            print(f"refusing unverified font source: {e}", file=sys.stderr)
+            return 1
+        try:
+            for weight, path in faces:
+                static_instance(variable_path, weight, os.path.join(ASSET_DIR, path))
+        finally:
+            os.remove(variable_path)
+
+    missing = [path for _, _, path in FONT_FACES if not os.path.exists(os.path.join(ASSET_DIR, path))]
+    if missing:
+        print("no source for: " + ", ".join(missing), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Every worker and job pool process writes its metrics to files here and
+# /metrics sums them. prometheus_client reads this when backend is
+# imported, so it has to be set in the config rather than a server hook.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "ebook-metrics"))
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# Import backend (WeasyPrint, pango, fontconfig, compiled templates) once in
+# the master and fork workers from it.
+preload_app = True
+
+
+def on_starting(server):
+    # Files left by a previous run would be summed into this one's metrics.
+    # Runs once per master, unlike this file, which is re-read on HUP.
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is
+    # forked, so the warm state is inherited by every worker. Without
+    # preload_app the master never imports backend; workers warm up in
+    # post_worker_init instead.
+    if not server.cfg.preload_app:
+        return
+    import backend
+
+    backend.ensure_warm()
+    if not backend.warm_state["ready"]:
+        # Missing fonts or a broken render stack: better not to start than to
+        # serve books with the wrong glyphs.
+        server.log.error("Warm-up failed, not starting: %s", backend.warm_state["error"])
+        sys.exit(1)
+    server.log.info("Warm-up finished: %s", backend.warm_state["timings_ms"])
+
+
+def post_fork(server, worker):
+    # The master's font files must outlive this worker.
+    if server.cfg.preload_app:
+        import backend
+
+        backend.disown_font_files()
+
+
+def post_worker_init(worker):
+    # Only does anything when preload_app is turned off; the worker then
+    # warms itself in the background and reports not-ready until done.
+    import backend
+
+    if not backend.warm_state["ready"]:
+        backend.start_warm_up()
+
+
+def child_exit(server, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)